@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from typing import List, Dict, Any
@@ -6,9 +6,14 @@ from app.core.deps import get_db, get_current_admin
 from app.models.user import User
 from app.schemas.user import UserCreate, User as UserSchema, UserUpdate
 from app.core.security import get_password_hash, verify_password
+from app.core.task_queue import TaskQueue
+from app.core.storage_manager import storage_manager
 
 router = APIRouter()
 
+# 获取任务队列单例
+task_queue = TaskQueue()
+
 @router.get("/users", response_model=List[Dict[str, Any]])
 async def get_all_users(
     db: AsyncSession = Depends(get_db),
@@ -186,4 +191,44 @@ async def change_admin_password(
         
     current_admin.hashed_password = get_password_hash(new_password)
     await db.commit()
-    return {"msg": "密码修改成功"}
\ No newline at end of file
+    return {"msg": "密码修改成功"}
+
+@router.get("/tasks", response_model=Dict[str, Any])
+async def get_all_tasks(
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    current_admin: User = Depends(get_current_admin)
+):
+    """分页获取所有任务（按创建时间倒序）及队列深度、工作协程使用情况（仅管理员）"""
+    total, tasks = await task_queue.query_tasks(limit=limit, offset=offset)
+    return {
+        "stats": await task_queue.get_queue_stats(),
+        "total": total,
+        "tasks": [{
+            "task_id": task.task_id,
+            "type": task.task_type,
+            "user_id": task.data.get("user_id"),
+            "status": task.status,
+            "progress": task.progress,
+            "worker_id": task.worker_id,
+            "retry_count": task.retry_count,
+            "created_at": task.created_at,
+            "updated_at": task.updated_at
+        } for task in tasks]
+    }
+
+@router.get("/storage", response_model=Dict[str, Any])
+async def get_storage_usage(
+    top_users: int = 20,
+    current_admin: User = Depends(get_current_admin)
+):
+    """各目录空间占用、用户用量及配额、孤儿文件和最近一轮清理结果（仅管理员）"""
+    return await storage_manager.report(top_users)
+
+@router.post("/storage/gc", response_model=Dict[str, Any])
+async def run_storage_gc(
+    full: bool = False,
+    current_admin: User = Depends(get_current_admin)
+):
+    """立即执行一轮空间清理，full 为 true 时重新扫描所有文件（仅管理员）"""
+    return await storage_manager.run_pass(full)
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Response
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Response, Query, Request
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, and_, or_
+from typing import List, Optional, Tuple
 import json
 import os
+import base64
 from datetime import datetime
 import uuid
 import mimetypes
@@ -19,7 +21,19 @@ from app.schemas.user import (
     DouyinGroup, ScheduledPost, DouyinStats
 )
 from app.models.user import User
-from app.core.task_queue import TaskQueue, Task, TaskStatus
+from app.models.post_history import PostHistory
+from app.core.task_queue import TaskQueue, Task, TaskStatus, TaskPriority
+from app.core.uploads import UploadTooLarge, check_upload_size, save_upload
+from app.core.upload_sessions import (
+    upload_sessions, UploadSessionError, UploadSessionNotFound, UploadIncomplete, UploadCompleting
+)
+from app.core.config import settings
+from app.core.blob_store import blob_store
+from app.core.media_response import MediaFileResponse
+from app.core.media import thumbnails, probe, touch_access
+from app.core.video_index import video_index, parse_probe
+from app.core.hls import hls_packager, HLS_MEDIA_TYPES
+from app.core.storage_manager import storage_manager, StorageQuotaExceeded
 
 router = APIRouter()
 
@@ -90,24 +104,147 @@ async def upload_video(
     file_path = os.path.join(UPLOAD_DIR, filename)
     
     try:
-        # 创建目录（如果不存在）
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        # 保存上传的视频文件
-        with open(file_path, "wb+") as file_object:
-            # 读取文件内容并写入
-            content = await video.read()
-            file_object.write(content)
+        # 分块流式保存上传的视频文件，同时计算校验和，相同内容只保存一份
+        tmp_path = blob_store.incoming_path()
+        await storage_manager.check_quota(current_user.id, video.size or 0)
+        size, sha256 = await save_upload(video, tmp_path)
+        await _check_saved_quota(current_user.id, size, tmp_path)
+        _, deduplicated = await blob_store.add_file(tmp_path, file_path, current_user.id, sha256)
+        metadata = await video_index.index(file_path, current_user.id, sha256)
             
         return {
             "success": True,
             "file_path": file_path,
             "title": title,
-            "description": description
+            "description": description,
+            "size": size,
+            "sha256": sha256,
+            "deduplicated": deduplicated,
+            "metadata": metadata
         }
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"视频文件超过大小限制（{e.max_size} 字节）")
+    except StorageQuotaExceeded as e:
+        raise _quota_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _check_saved_quota(user_id: int, size: int, tmp_path: str):
+    """保存完成后按实际大小检查配额，超出时删除临时文件"""
+    try:
+        await storage_manager.check_quota(user_id, size)
+    except StorageQuotaExceeded:
+        os.remove(tmp_path)
+        raise
+
+def _quota_error(e: StorageQuotaExceeded) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"存储空间超过配额（已用 {e.used} 字节，配额 {e.quota} 字节）")
+
+def _upload_session_info(meta: dict) -> dict:
+    received_bytes = sum(end - start for start, end in meta["received"])
+    return {
+        "upload_id": meta["upload_id"],
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "received": meta["received"],
+        "received_bytes": received_bytes,
+        "complete": received_bytes == meta["size"]
+    }
+
+@router.post("/uploads")
+async def create_upload_session(
+    filename: str = Form(...),
+    size: int = Form(..., ge=0),
+    sha256: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_user)
+):
+    """创建可续传的上传会话，之后按偏移分块上传"""
+    if size > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail=f"视频文件超过大小限制（{settings.MAX_UPLOAD_SIZE} 字节）")
+    try:
+        await storage_manager.check_quota(current_user.id, size)
+    except StorageQuotaExceeded as e:
+        raise _quota_error(e)
+    meta = await upload_sessions.create(current_user.id, filename, size, sha256)
+    return {**_upload_session_info(meta), "chunk_size": settings.UPLOAD_CHUNK_SIZE}
+
+@router.get("/uploads/{upload_id}")
+async def get_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """查询已接收的区间，用于断线后续传"""
+    try:
+        meta = await upload_sessions.get(upload_id, current_user.id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    return _upload_session_info(meta)
+
+@router.put("/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_user: User = Depends(get_current_user)
+):
+    """把请求体作为分块写入 offset 位置，分块可以乱序或并行上传"""
+    try:
+        meta = await upload_sessions.write_chunk(upload_id, current_user.id, offset, request.stream())
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    except UploadCompleting as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _upload_session_info(meta)
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload_session(
+    upload_id: str,
+    title: str = Form(None),
+    description: str = Form(None),
+    current_user: User = Depends(get_current_user)
+):
+    """所有分块到齐后生成上传文件，返回值与 /upload-video 一致"""
+    try:
+        meta = await upload_sessions.get(upload_id, current_user.id)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_path = os.path.join(UPLOAD_DIR, f"{timestamp}_{meta['filename']}")
+        tmp_path = blob_store.incoming_path()
+        size, sha256 = await upload_sessions.complete(upload_id, current_user.id, tmp_path)
+        _, deduplicated = await blob_store.add_file(tmp_path, file_path, current_user.id, sha256)
+        metadata = await video_index.index(file_path, current_user.id, sha256)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    except UploadIncomplete:
+        raise HTTPException(status_code=409, detail="文件尚未上传完整")
+    except UploadCompleting as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "file_path": file_path,
+        "title": title,
+        "description": description,
+        "size": size,
+        "sha256": sha256,
+        "deduplicated": deduplicated,
+        "metadata": metadata
+    }
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        await upload_sessions.abort(upload_id, current_user.id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    return {"success": True}
+
 # 更新原有的batch_post路由以支持发布历史记录
 @router.post("/batch-post")
 async def batch_post_video(
@@ -116,7 +253,7 @@ async def batch_post_video(
     title: str = Form(...),
     description: str = Form(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if not os.path.exists(video_path):
         raise HTTPException(status_code=400, detail="视频文件不存在")
@@ -132,26 +269,27 @@ async def batch_post_video(
                 "title": title,
                 "description": description
             },
-            "user_id": current_user.id
+            "user_id": current_user.id,
+            "priority": TaskPriority.INTERACTIVE
         }
     )
     
     # 创建历史记录
-    history = current_user.douyin_history or []
-    history.append({
-        "task_id": task_id,
-        "video_id": str(uuid.uuid4()),  # 临时视频ID
-        "title": title,
-        "description": description,
-        "accounts": accounts,
-        "success_count": 0,
-        "failed_count": 0,
-        "created_at": datetime.now().isoformat(),
-        "status": "pending",
-        "retries": 0
-    })
-    current_user.douyin_history = history
-    db.commit()
+    db.add(PostHistory(
+        task_id=task_id,
+        user_id=current_user.id,
+        video_id=str(uuid.uuid4()),  # 临时视频ID
+        title=title,
+        description=description,
+        accounts=accounts,
+        failed_accounts=[],
+        success_count=0,
+        failed_count=0,
+        created_at=datetime.now(),
+        status="pending",
+        retries=0
+    ))
+    await db.commit()
     
     await task_queue.add_task(task)
     
@@ -160,12 +298,16 @@ async def batch_post_video(
         "message": "任务已添加到队列"
     }
 
+def _task_video_path(task: Task) -> Optional[str]:
+    """任务的源视频路径：视频处理任务为原始视频，发布任务为待发布视频"""
+    return task.data.get("original_path") or (task.data.get("video_info") or {}).get("path")
+
 @router.get("/task/{task_id}")
 async def get_task_status(
     task_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    task = task_queue.get_task(task_id)
+    task = await task_queue.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
@@ -175,22 +317,40 @@ async def get_task_status(
         "progress": task.progress,
         "result": task.result,
         "error": task.error,
+        "retry_count": task.retry_count,
+        "max_retries": task.max_retries,
+        "next_attempt_at": task.next_attempt_at,
         "created_at": task.created_at,
-        "updated_at": task.updated_at
+        "updated_at": task.updated_at,
+        "video": await video_index.get(_task_video_path(task))
     }
 
 @router.get("/tasks")
 async def get_user_tasks(
+    response: Response,
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     current_user: User = Depends(get_current_user)
 ):
-    tasks = task_queue.get_all_tasks()
-    user_tasks = [task for task in tasks if task.data.get("user_id") == current_user.id]
+    """获取当前用户的任务，总数通过 X-Total-Count 响应头返回"""
+    total, user_tasks = await task_queue.query_tasks(
+        user_id=current_user.id,
+        status=status,
+        task_type=type,
+        limit=limit,
+        offset=offset
+    )
+    response.headers["X-Total-Count"] = str(total)
     
     return [{
         "task_id": task.task_id,
         "type": task.task_type,
         "status": task.status,
         "progress": task.progress,
+        "retry_count": task.retry_count,
+        "next_attempt_at": task.next_attempt_at,
         "created_at": task.created_at,
         "updated_at": task.updated_at
     } for task in user_tasks]
@@ -287,7 +447,8 @@ async def schedule_post(
                 "description": schedule.description
             },
             "user_id": current_user.id,
-            "schedule_time": schedule.schedule_time
+            "schedule_time": schedule.schedule_time,
+            "priority": TaskPriority.INTERACTIVE
         }
     )
     
@@ -299,37 +460,88 @@ async def schedule_post(
         "schedule_time": schedule.schedule_time
     }
 
+def encode_history_cursor(record: PostHistory) -> str:
+    raw = f"{record.created_at.isoformat()}|{record.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor: str):
+    try:
+        created_at, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(record_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
 @router.get("/history")
 async def get_post_history(
-    current_user: User = Depends(get_current_user)
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    return current_user.douyin_history or []
+    """按创建时间倒序分页获取发布历史，下一页游标通过 X-Next-Cursor 响应头返回"""
+    query = select(PostHistory).where(PostHistory.user_id == current_user.id)
+    if status:
+        query = query.where(PostHistory.status == status)
+    if start:
+        query = query.where(PostHistory.created_at >= start)
+    if end:
+        query = query.where(PostHistory.created_at < end)
+    if cursor:
+        cursor_created_at, cursor_id = decode_history_cursor(cursor)
+        query = query.where(or_(
+            PostHistory.created_at < cursor_created_at,
+            and_(PostHistory.created_at == cursor_created_at, PostHistory.id < cursor_id)
+        ))
+    query = query.order_by(PostHistory.created_at.desc(), PostHistory.id.desc()).limit(limit + 1)
+    
+    result = await db.execute(query)
+    records = result.scalars().all()
+    if len(records) > limit:
+        records = records[:limit]
+        response.headers["X-Next-Cursor"] = encode_history_cursor(records[-1])
+    
+    return [record.to_dict() for record in records]
 
 @router.get("/stats")
 async def get_stats(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    history = current_user.douyin_history or []
-    total_posts = len(history)
-    success_count = sum(1 for post in history if post.get("success_count", 0) > 0)
+    result = await db.execute(
+        select(
+            func.count(PostHistory.id),
+            func.count(PostHistory.id).filter(PostHistory.success_count > 0)
+        ).where(PostHistory.user_id == current_user.id)
+    )
+    total_posts, success_count = result.one()
     account_stats = {}
     
-    for post in history:
-        for account in post.get("accounts", []):
+    result = await db.execute(
+        select(PostHistory.accounts, PostHistory.failed_accounts, PostHistory.status)
+        .where(PostHistory.user_id == current_user.id)
+    )
+    for accounts, failed_accounts, status in result.all():
+        failed_accounts = failed_accounts or []
+        for account in accounts or []:
             if account not in account_stats:
                 account_stats[account] = {"success": 0, "failed": 0}
             
-            if account in post.get("success_accounts", []):
-                account_stats[account]["success"] += 1
-            elif account in post.get("failed_accounts", []):
+            if account in failed_accounts:
                 account_stats[account]["failed"] += 1
+            elif status == TaskStatus.COMPLETED:
+                account_stats[account]["success"] += 1
     
     success_rate = (success_count / total_posts) if total_posts > 0 else 0
     
     return DouyinStats(
         total_posts=total_posts,
         success_rate=success_rate,
-        account_stats=account_stats
+        account_stats=account_stats,
+        video_stats=await video_index.user_summary(current_user.id)
     )
 
 @router.post("/preview")
@@ -348,7 +560,8 @@ async def preview_video(
         "video_info": {
             "path": video_path,
             "size": os.path.getsize(video_path),
-            "created": datetime.fromtimestamp(os.path.getctime(video_path)).isoformat()
+            "created": datetime.fromtimestamp(os.path.getctime(video_path)).isoformat(),
+            "metadata": await video_index.get(video_path)
         }
     }
 
@@ -357,78 +570,175 @@ async def create_preview(
     filename: str,
     current_user: User = Depends(get_current_user)
 ):
-    video_path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.exists(video_path):
+    video_path = os.path.join(UPLOAD_DIR, os.path.basename(filename))
+    if not os.path.isfile(video_path):
         raise HTTPException(status_code=404, detail="视频文件不存在")
     
-    # 生成预览图路径
-    preview_path = os.path.join(PREVIEW_DIR, f"{os.path.splitext(filename)[0]}.jpg")
-    
     try:
-        # 使用ffmpeg生成预览图
-        os.system(f'ffmpeg -i "{video_path}" -ss 00:00:01 -vframes 1 "{preview_path}"')
+        # 预览图按文件内容缓存，并发请求同一视频时只生成一次
+        preview_path, metadata = await asyncio.gather(
+            thumbnails.get_preview(video_path),
+            video_index.get(video_path)
+        )
         
         return {
             "preview_url": f"/static/previews/{os.path.basename(preview_path)}",
             "video_info": {
                 "path": video_path,
                 "size": os.path.getsize(video_path),
-                "duration": get_video_duration(video_path),
-                "created": datetime.fromtimestamp(os.path.getctime(video_path)).isoformat()
+                "duration": metadata["duration"] if metadata and metadata["duration"] else 0.0,
+                "created": datetime.fromtimestamp(os.path.getctime(video_path)).isoformat(),
+                "metadata": metadata
             }
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成预览图失败: {str(e)}")
 
-@router.get("/video/{filename}")
+@router.api_route("/video/{filename}", methods=["GET", "HEAD"])
 async def stream_video(
     filename: str,
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
-    video_path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.exists(video_path):
+    """播放上传或处理后的视频，支持拖动进度条（Range）和浏览器缓存"""
+    filename = os.path.basename(filename)
+    for video_dir in (UPLOAD_DIR, PROCESSED_DIR):
+        video_path = os.path.join(video_dir, filename)
+        if os.path.isfile(video_path):
+            break
+    else:
         raise HTTPException(status_code=404, detail="视频文件不存在")
     
-    return FileResponse(
+    return MediaFileResponse(
+        request,
         video_path,
         media_type=mimetypes.guess_type(filename)[0],
         filename=filename
     )
 
-def get_video_duration(video_path: str) -> float:
-    """使用ffprobe获取视频时长"""
+@router.get("/preview/{filename}/sprite")
+async def get_preview_sprite(
+    filename: str,
+    current_user: User = Depends(get_current_user)
+):
+    """鼠标悬停拖动预览用的缩略图雪碧图及时间索引（WebVTT/JSON），首次请求时生成"""
+    video_path = os.path.join(UPLOAD_DIR, os.path.basename(filename))
+    if not os.path.isfile(video_path):
+        raise HTTPException(status_code=404, detail="视频文件不存在")
+    
     try:
-        import subprocess
-        cmd = [
-            'ffprobe',
-            '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            video_path
-        ]
-        output = subprocess.check_output(cmd).decode().strip()
-        return float(output)
-    except Exception:
-        return 0.0
+        sprite = await thumbnails.get_sprite(video_path, await video_index.get(video_path))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成预览雪碧图失败: {str(e)}")
+    
+    return {
+        **sprite,
+        "sprite_url": f"/static/previews/{sprite['sprite']}",
+        "vtt_url": f"/static/previews/{sprite['vtt']}"
+    }
+
+@router.get("/hls/{sha256}/{file_path:path}")
+async def stream_hls(
+    sha256: str,
+    file_path: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """审核预览用的 HLS 播放列表和分片，内容按哈希寻址，可以长期缓存"""
+    parts = file_path.split("/")
+    if (len(sha256) != 64 or not all(c in "0123456789abcdef" for c in sha256)
+            or any(part in ("", ".", "..") for part in parts)):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    if not hls_packager.is_ready(sha256):
+        blob_path = blob_store.blob_path(sha256)
+        if settings.HLS_ENABLED and os.path.isfile(blob_path):
+            # HLS 尚未生成或生成被中断，后台重新生成
+            try:
+                metadata = parse_probe(await probe(blob_path))
+            except Exception:
+                metadata = None
+            hls_packager.schedule(blob_path, sha256, metadata)
+            raise HTTPException(status_code=404, detail="HLS 正在生成，请稍后重试")
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    path = os.path.join(hls_packager.output_dir(sha256), *parts)
+    media_type = HLS_MEDIA_TYPES.get(os.path.splitext(path)[1])
+    if media_type is None or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    if parts == ["master.m3u8"]:
+        touch_access(path)
+    response = MediaFileResponse(request, path, media_type=media_type)
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+@router.delete("/video/{filename}")
+async def delete_video(
+    filename: str,
+    current_user: User = Depends(get_current_user)
+):
+    """删除用户的视频文件，共享内容在没有其他引用时才会删除"""
+    video_path = os.path.join(UPLOAD_DIR, os.path.basename(filename))
+    info = await blob_store.video_info(video_path)
+    if info is None or (info["user_id"] != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="视频文件不存在")
+    
+    await blob_store.release(video_path)
+    await video_index.remove(video_path)
+    return {"success": True}
+
+async def _resolve_uploaded_path(video_path: str, current_user: User) -> Tuple[str, dict]:
+    """只允许引用上传目录中当前用户自己的文件（管理员不限），返回 (文件路径, 内容信息)"""
+    resolved = os.path.join(UPLOAD_DIR, os.path.basename(video_path))
+    if os.path.realpath(video_path) != os.path.realpath(resolved) or not os.path.isfile(resolved):
+        raise HTTPException(status_code=404, detail=f"视频文件不存在: {video_path}")
+    info = await blob_store.video_info(resolved)
+    if info is None or (info["user_id"] != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail=f"视频文件不存在: {video_path}")
+    return resolved, info
 
 @router.post("/batch-process-videos")
 async def batch_process_videos(
-    videos: List[UploadFile] = File(...),
+    videos: List[UploadFile] = File(None),
+    video_paths: List[str] = Form(None),
     text: str = Form(...),
     current_user: User = Depends(get_current_user)
 ):
+    # 除直接上传外，也可以处理通过 /uploads 续传完成的视频（video_paths）
+    videos = videos or []
+    existing = [await _resolve_uploaded_path(path, current_user) for path in (video_paths or [])]
+    total = len(videos) + len(existing)
+    if not total:
+        raise HTTPException(status_code=400, detail="请上传视频或指定已上传的视频")
+    
     try:
-        processed_videos = []
+        # 任何一个视频超限时，在保存之前拒绝整个批次
         for video in videos:
-            # 保存原始视频
+            check_upload_size(video)
+        
+        sources = []
+        for video in videos:
+            # 分块流式保存原始视频
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             original_filename = f"{timestamp}_{video.filename}"
             original_path = os.path.join(UPLOAD_DIR, original_filename)
             
-            with open(original_path, "wb+") as file_object:
-                content = await video.read()
-                file_object.write(content)
-            
+            tmp_path = blob_store.incoming_path()
+            await storage_manager.check_quota(current_user.id, video.size or 0)
+            size, sha256 = await save_upload(video, tmp_path)
+            await _check_saved_quota(current_user.id, size, tmp_path)
+            await blob_store.add_file(tmp_path, original_path, current_user.id, sha256)
+            await video_index.index(original_path, current_user.id, sha256)
+            sources.append((original_path, original_filename, size, sha256))
+        for original_path, info in existing:
+            sources.append((
+                original_path, os.path.basename(original_path),
+                os.path.getsize(original_path), info["sha256"]
+            ))
+        
+        processed_videos = []
+        for original_path, original_filename, size, sha256 in sources:
             # 创建处理任务
             task_id = str(uuid.uuid4())
             processed_filename = f"processed_{original_filename}"
@@ -441,7 +751,10 @@ async def batch_process_videos(
                     "original_path": original_path,
                     "processed_path": processed_path,
                     "text": text,
-                    "user_id": current_user.id
+                    "sha256": sha256,
+                    "user_id": current_user.id,
+                    # 单个视频按交互任务处理，批量提交的视频按批量任务处理
+                    "priority": TaskPriority.INTERACTIVE if total == 1 else TaskPriority.BULK
                 }
             )
             
@@ -449,15 +762,21 @@ async def batch_process_videos(
             processed_videos.append({
                 "task_id": task_id,
                 "original_filename": original_filename,
-                "processed_filename": processed_filename
+                "processed_filename": processed_filename,
+                "size": size,
+                "sha256": sha256
             })
         
         return {
             "success": True,
-            "message": f"{len(videos)} videos queued for processing",
+            "message": f"{total} videos queued for processing",
             "tasks": processed_videos
         }
         
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"视频文件超过大小限制（{e.max_size} 字节）")
+    except StorageQuotaExceeded as e:
+        raise _quota_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -466,12 +785,15 @@ async def get_process_status(
     task_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    task = task_queue.get_task(task_id)
+    task = await task_queue.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     return {
         "status": task.status,
         "progress": task.progress,
-        "result": task.result
+        "result": task.result,
+        "retry_count": task.retry_count,
+        "next_attempt_at": task.next_attempt_at,
+        "video": await video_index.get(_task_video_path(task))
     }
\ No newline at end of file
@@ -1,120 +1,139 @@
 import os
+import asyncio
 import logging
-import aiohttp
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from app.core.config import settings
+from app.core.blob_store import file_sha256
+from app.core.http_client import HttpClient, http_client
+from app.core.transfers import StreamingForm, download_to
+from app.core.voice_cache import VoiceCache, voice_cache
 
 logger = logging.getLogger(__name__)
 
 class RunwayMLService:
     """使用RunwayML的API进行视频修复和字幕移除"""
-    def __init__(self):
+    def __init__(self, client: HttpClient = http_client):
+        self.client = client
         self.api_key = settings.RUNWAY_API_KEY
         self.api_base = "https://api.runwayml.com/v1"
+        self.transfers = []  # 每次上传/下载的字节数和吞吐量
 
     async def inpaint_video(self, input_path: str, output_path: str, mask_type: str = "text", restoration_quality: str = "high"):
         """
         使用RunwayML的Inpainting模型移除视频中的字幕并修复背景
         """
-        async with aiohttp.ClientSession() as session:
-            # 1. 上传视频
-            upload_url = f"{self.api_base}/uploads"
-            async with session.post(upload_url, 
-                                 headers={"Authorization": f"Bearer {self.api_key}"},
-                                 data={'file': open(input_path, 'rb')}) as response:
-                upload_result = await response.json()
+        session = self.client.session
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        # 1. 上传视频
+        upload_url = f"{self.api_base}/uploads"
+        form = StreamingForm("runway.upload")
+        await form.add_file("file", input_path)
+        async with session.post(upload_url, headers=headers, data=form.writer) as response:
+            self.transfers.append(form.finish())
+            response.raise_for_status()
+            upload_result = await response.json()
                 
-            # 2. 开始处理任务
-            payload = {
-                "input": {
-                    "video": upload_result["url"],
-                    "mask_type": mask_type,
-                    "restoration_quality": restoration_quality
-                }
+        # 2. 开始处理任务
+        payload = {
+            "input": {
+                "video": upload_result["url"],
+                "mask_type": mask_type,
+                "restoration_quality": restoration_quality
             }
+        }
             
-            inference_url = f"{self.api_base}/inference"
-            async with session.post(inference_url,
-                                 headers={"Authorization": f"Bearer {self.api_key}"},
-                                 json=payload) as response:
-                result = await response.json()
+        inference_url = f"{self.api_base}/inference"
+        async with session.post(inference_url, headers=headers, json=payload) as response:
+            response.raise_for_status()
+            result = await response.json()
                 
-            # 3. 下载处理后的视频
-            async with session.get(result["output"]["video"],
-                                headers={"Authorization": f"Bearer {self.api_key}"}) as response:
-                with open(output_path, 'wb') as f:
-                    while True:
-                        chunk = await response.content.read(8192)
-                        if not chunk:
-                            break
-                        f.write(chunk)
+        # 3. 下载处理后的视频
+        async with session.get(result["output"]["video"], headers=headers) as response:
+            self.transfers.append(await download_to(response, output_path, "runway.download"))
 
 class VoiceCloningService:
-    """使用Coqui TTS或YourTTS进行声音克隆"""
-    def __init__(self):
+    """使用Coqui TTS或YourTTS进行声音克隆
+
+    声音特征和合成语音经过 VoiceCache 缓存，相同输入不会重复调用接口。
+    """
+    def __init__(self, client: HttpClient = http_client, cache: Optional[VoiceCache] = voice_cache):
+        self.client = client
+        self.cache = cache if settings.VOICE_CACHE_ENABLED else None
         self.api_key = settings.COQUI_API_KEY
         self.api_base = "https://api.coqui.ai/v2"
+        self.transfers = []
+        self.cache_hits = {}  # 操作 -> 命中层级 memory/disk/miss
+
+    async def extract_voice_features(self, audio_path: str, audio_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """从原始音频中提取说话人的声音特征，audio_sha256 为音频文件内容的哈希，未提供时计算"""
+        if self.cache is None:
+            return await self._extract_voice_features(audio_path)
+        if audio_sha256 is None:
+            audio_sha256 = await asyncio.to_thread(file_sha256, audio_path)
+        features, self.cache_hits["voice_features"] = await self.cache.get_features(
+            audio_sha256, lambda: self._extract_voice_features(audio_path)
+        )
+        return features
 
-    async def extract_voice_features(self, audio_path: str) -> Dict[str, Any]:
-        """从原始音频中提取说话人的声音特征"""
-        async with aiohttp.ClientSession() as session:
-            upload_url = f"{self.api_base}/voice/extract_features"
-            async with session.post(upload_url,
-                                 headers={"Authorization": f"Bearer {self.api_key}"},
-                                 data={'audio': open(audio_path, 'rb')}) as response:
-                return await response.json()
+    async def _extract_voice_features(self, audio_path: str) -> Dict[str, Any]:
+        session = self.client.session
+        upload_url = f"{self.api_base}/voice/extract_features"
+        form = StreamingForm("coqui.upload")
+        await form.add_file("audio", audio_path)
+        async with session.post(upload_url,
+                             headers={"Authorization": f"Bearer {self.api_key}"},
+                             data=form.writer) as response:
+            self.transfers.append(form.finish())
+            response.raise_for_status()
+            return await response.json()
 
-    async def generate_speech(self, text: str, voice_features: Dict[str, Any], output_path: str):
+    async def generate_speech(self, text: str, voice_features: Dict[str, Any], output_path: str, quality: str = "high"):
         """使用提取的声音特征生成新的语音"""
-        async with aiohttp.ClientSession() as session:
-            generate_url = f"{self.api_base}/tts/clone"
-            payload = {
-                "text": text,
-                "voice_features": voice_features,
-                "quality": "high"
-            }
+        if self.cache is None:
+            return await self._generate_speech(text, voice_features, output_path, quality)
+        key = self.cache.speech_key(text, voice_features, quality)
+        self.cache_hits["speech"] = await self.cache.get_speech(
+            key, output_path, lambda path: self._generate_speech(text, voice_features, path, quality)
+        )
+
+    async def _generate_speech(self, text: str, voice_features: Dict[str, Any], output_path: str, quality: str):
+        session = self.client.session
+        generate_url = f"{self.api_base}/tts/clone"
+        payload = {
+            "text": text,
+            "voice_features": voice_features,
+            "quality": quality
+        }
             
-            async with session.post(generate_url,
-                                 headers={"Authorization": f"Bearer {self.api_key}"},
-                                 json=payload) as response:
-                with open(output_path, 'wb') as f:
-                    while True:
-                        chunk = await response.content.read(8192)
-                        if not chunk:
-                            break
-                        f.write(chunk)
+        async with session.post(generate_url,
+                             headers={"Authorization": f"Bearer {self.api_key}"},
+                             json=payload) as response:
+            self.transfers.append(await download_to(response, output_path, "coqui.download"))
 
 class LipSyncService:
     """使用SadTalker进行唇形同步"""
-    def __init__(self):
+    def __init__(self, client: HttpClient = http_client):
+        self.client = client
         self.api_key = settings.SADTALKER_API_KEY
         self.api_base = "https://api.sadtalker.io/v1"
+        self.transfers = []
 
     async def sync_video_with_audio(self, video_path: str, audio_path: str, output_path: str, sync_quality: str = "high"):
         """将视频和音频进行唇形同步"""
-        async with aiohttp.ClientSession() as session:
-            # 1. 上传视频和音频
-            files = {
-                'video': open(video_path, 'rb'),
-                'audio': open(audio_path, 'rb')
-            }
-            
-            payload = {
-                'quality': sync_quality,
-                'enhance_face': True,
-                'sync_precision': 'frame'
-            }
+        session = self.client.session
+        # 1. 上传视频和音频
+        form = StreamingForm("sadtalker.upload")
+        form.add_field("quality", sync_quality)
+        form.add_field("enhance_face", "true")
+        form.add_field("sync_precision", "frame")
+        await form.add_file("video", video_path)
+        await form.add_file("audio", audio_path)
             
-            sync_url = f"{self.api_base}/sync"
-            async with session.post(sync_url,
-                                headers={"Authorization": f"Bearer {self.api_key}"},
-                                data=payload,
-                                files=files) as response:
-                # 下载处理后的视频
-                with open(output_path, 'wb') as f:
-                    while True:
-                        chunk = await response.content.read(8192)
-                        if not chunk:
-                            break
-                        f.write(chunk)
\ No newline at end of file
+        sync_url = f"{self.api_base}/sync"
+        async with session.post(sync_url,
+                            headers={"Authorization": f"Bearer {self.api_key}"},
+                            data=form.writer) as response:
+            self.transfers.append(form.finish())
+            # 下载处理后的视频
+            self.transfers.append(await download_to(response, output_path, "sadtalker.download"))
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.sqlite import insert
+
+from app.core.config import settings
+from app.db.database import sync_engine
+from app.models.video_blob import VideoBlob, UserVideo, ProcessedVideo
+
+logger = logging.getLogger(__name__)
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _link(src: str, dst: str):
+    """硬链接 src 到 dst，文件系统不支持时退回复制"""
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.link"
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+class BlobStore:
+    """内容寻址的视频存储
+
+    视频内容按 SHA-256 保存在 blobs 目录中，每份内容只保存一次并记录引用计数；
+    用户看到的文件路径（如 uploads/videos/时间戳_文件名）是指向内容的硬链接，
+    现有按路径读取文件的代码不需要改动。引用计数归零时删除内容文件。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def incoming_path(self) -> str:
+        """上传过程中的临时文件路径，与内容目录在同一文件系统，写完后可直接移入"""
+        return os.path.join(self.root, "incoming", uuid.uuid4().hex)
+
+    def _acquire_blob(self, conn, sha256: str, size: int):
+        conn.execute(
+            insert(VideoBlob.__table__)
+            .values(sha256=sha256, size=size, ref_count=1, created_at=datetime.now())
+            .on_conflict_do_update(
+                index_elements=["sha256"],
+                set_={"ref_count": VideoBlob.__table__.c.ref_count + 1}
+            )
+        )
+
+    def _release_blob(self, conn, sha256: str) -> bool:
+        """引用计数减一，归零时删除记录，返回是否需要删除内容文件"""
+        blobs = VideoBlob.__table__
+        conn.execute(update(blobs).where(blobs.c.sha256 == sha256).values(ref_count=blobs.c.ref_count - 1))
+        result = conn.execute(delete(blobs).where(blobs.c.sha256 == sha256, blobs.c.ref_count <= 0))
+        return result.rowcount > 0
+
+    def _add(self, src_path: str, sha256: str, dest_path: str, user_id: Optional[int],
+             move: bool) -> bool:
+        with self._lock:
+            blob_path = self.blob_path(sha256)
+            existed = os.path.exists(blob_path)
+            if not existed:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                if move:
+                    os.replace(src_path, blob_path)
+                else:
+                    _link(src_path, blob_path)
+            elif move:
+                os.remove(src_path)
+
+            videos = UserVideo.__table__
+            with sync_engine.begin() as conn:
+                previous = conn.execute(select(videos.c.sha256).where(videos.c.path == dest_path)).scalar()
+                if previous != sha256:
+                    self._acquire_blob(conn, sha256, os.path.getsize(blob_path))
+                    conn.execute(
+                        insert(videos)
+                        .values(user_id=user_id, path=dest_path, sha256=sha256, created_at=datetime.now())
+                        .on_conflict_do_update(index_elements=["path"], set_={"sha256": sha256, "user_id": user_id})
+                    )
+                    remove_previous = previous is not None and self._release_blob(conn, previous)
+                else:
+                    remove_previous = False
+
+            if not (os.path.exists(dest_path) and os.path.samefile(blob_path, dest_path)):
+                _link(blob_path, dest_path)
+            if remove_previous:
+                self._remove_blob_file(previous)
+            return existed
+
+    async def add_file(self, src_path: str, dest_path: str, user_id: Optional[int],
+                       sha256: Optional[str] = None, move: bool = True) -> Tuple[str, bool]:
+        """把文件存入内容存储，并让 dest_path 指向该内容
+
+        move 为 True 时 src_path 会被移走或删除。返回 (SHA-256, 内容是否已存在)。
+        """
+        if sha256 is None:
+            sha256 = await asyncio.to_thread(file_sha256, src_path)
+        existed = await asyncio.to_thread(self._add, src_path, sha256, dest_path, user_id, move)
+        return sha256, existed
+
+    def _remove_blob_file(self, sha256: str):
+        try:
+            os.remove(self.blob_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def _release(self, path: str) -> bool:
+        with self._lock:
+            videos = UserVideo.__table__
+            with sync_engine.begin() as conn:
+                sha256 = conn.execute(select(videos.c.sha256).where(videos.c.path == path)).scalar()
+                if sha256 is None:
+                    return False
+                conn.execute(delete(videos).where(videos.c.path == path))
+                remove_blob = self._release_blob(conn, sha256)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            if remove_blob:
+                self._remove_blob_file(sha256)
+            return True
+
+    async def release(self, path: str) -> bool:
+        """删除用户文件并释放对内容的引用，返回该路径是否由内容存储管理"""
+        return await asyncio.to_thread(self._release, path)
+
+    def _video_info(self, path: str) -> Optional[dict]:
+        videos = UserVideo.__table__
+        with sync_engine.connect() as conn:
+            row = conn.execute(
+                select(videos.c.sha256, videos.c.user_id).where(videos.c.path == path)
+            ).first()
+        return {"sha256": row.sha256, "user_id": row.user_id} if row else None
+
+    async def video_info(self, path: str) -> Optional[dict]:
+        """用户文件对应的内容哈希和所属用户，不由内容存储管理时返回 None"""
+        return await asyncio.to_thread(self._video_info, path)
+
+    def _find_processed(self, input_sha256: str, text: str) -> Optional[str]:
+        cache = ProcessedVideo.__table__
+        with sync_engine.connect() as conn:
+            output_sha256 = conn.execute(
+                select(cache.c.output_sha256).where(
+                    cache.c.input_sha256 == input_sha256,
+                    cache.c.text_sha256 == text_sha256(text)
+                )
+            ).scalar()
+        if output_sha256 and os.path.exists(self.blob_path(output_sha256)):
+            return output_sha256
+        return None
+
+    async def find_processed(self, input_sha256: str, text: str) -> Optional[str]:
+        """查找相同输入视频和文本的处理结果，返回结果内容的 SHA-256"""
+        return await asyncio.to_thread(self._find_processed, input_sha256, text)
+
+    def _record_processed(self, input_sha256: str, text: str, output_sha256: str):
+        cache = ProcessedVideo.__table__
+        with self._lock, sync_engine.begin() as conn:
+            result = conn.execute(
+                insert(cache)
+                .values(
+                    input_sha256=input_sha256,
+                    text_sha256=text_sha256(text),
+                    output_sha256=output_sha256,
+                    created_at=datetime.now()
+                )
+                .on_conflict_do_nothing(index_elements=["input_sha256", "text_sha256"])
+            )
+            if result.rowcount:
+                # 缓存记录本身持有一个引用，用户删除处理结果后仍可复用
+                self._acquire_blob(conn, output_sha256, os.path.getsize(self.blob_path(output_sha256)))
+
+    async def store_processed(self, input_sha256: str, text: str, output_path: str,
+                              user_id: Optional[int]) -> str:
+        """把处理结果存入内容存储并登记为 (输入, 文本) 的缓存结果"""
+        output_sha256, _ = await self.add_file(output_path, output_path, user_id, move=False)
+        await asyncio.to_thread(self._record_processed, input_sha256, text, output_sha256)
+        return output_sha256
+
+# 全局内容存储
+blob_store = BlobStore(settings.BLOB_DIR)
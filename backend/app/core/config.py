@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional, List
+from typing import Any, Optional, List, Dict
 import os
 from functools import lru_cache
 import yaml
@@ -30,16 +30,100 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "uploads/videos"
     PREVIEW_DIR: str = "static/previews"
     MAX_UPLOAD_SIZE: int = 100 * 1024 * 1024  # 100MB
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 上传文件每次读写的块大小
+    BLOB_DIR: str = "uploads/blobs"  # 按内容存储的视频，需与上传目录在同一文件系统
+    UPLOAD_SESSION_DIR: str = "uploads/upload_sessions"  # 续传会话目录，需与上传目录在同一文件系统
+    UPLOAD_SESSION_TTL: int = 24 * 3600  # 续传会话无新分块多久后删除（秒）
+    PROCESSED_DIR: str = "uploads/processed_videos"
+    
+    # 存储空间管理
+    STORAGE_SCAN_INTERVAL: int = 300  # 增量扫描和清理的间隔（秒）
+    STORAGE_FULL_SCAN_INTERVAL: int = 24 * 3600  # 完整扫描的间隔（秒），校正原地修改的文件
+    STORAGE_ORPHAN_GRACE: int = 3600  # 临时文件、中间文件和无引用文件至少保留多久（秒）
+    STORAGE_DELETE_UNTRACKED: bool = False  # 是否删除上传目录中不属于任何用户的文件，默认只报告
+    STORAGE_USER_QUOTA: int = 10 * 1024 * 1024 * 1024  # 每个用户的存储配额（字节），0 表示不限制
+    STORAGE_USER_QUOTAS: Dict[str, int] = {}  # 用户ID -> 单独设置的配额
+    STORAGE_POLICIES: Dict[str, Dict[str, int]] = {  # 可再生成的缓存：ttl 为最近访问后保留的秒数
+        "previews": {"ttl": 30 * 24 * 3600, "max_bytes": 2 * 1024 * 1024 * 1024},
+        "hls": {"ttl": 14 * 24 * 3600, "max_bytes": 20 * 1024 * 1024 * 1024},
+        "proxies": {"ttl": 3 * 24 * 3600, "max_bytes": 10 * 1024 * 1024 * 1024},
+        "voice": {"ttl": 30 * 24 * 3600, "max_bytes": 2 * 1024 * 1024 * 1024},
+    }
+    
+    # 媒体处理配置（ffmpeg/ffprobe）
+    MEDIA_WORKERS: int = 4  # 同时运行的 ffmpeg/ffprobe 进程数
+    MEDIA_COMMAND_TIMEOUT: float = 120  # 单个命令的超时时间（秒）
+    SPRITE_COLUMNS: int = 10  # 拖动预览雪碧图的列数
+    SPRITE_ROWS: int = 10  # 拖动预览雪碧图的最大行数
+    SPRITE_TILE_WIDTH: int = 160  # 每个缩略图的宽度（像素）
+    
+    # 审核预览用的 HLS 多码率转码
+    HLS_ENABLED: bool = True
+    HLS_DIR: str = "uploads/hls"
+    HLS_WORKERS: int = 1  # 同时运行的 HLS 转码进程数
+    HLS_THREADS: int = 2  # 每个转码进程使用的线程数
+    HLS_TIMEOUT: float = 1800  # 单个视频转码超时时间（秒）
+    HLS_SEGMENT_SECONDS: int = 4
+    HLS_LADDER: List[Dict[str, Any]] = [  # height 为短边像素数，超过源视频的档位会被跳过
+        {"name": "360p", "height": 360, "video_bitrate": "800k", "audio_bitrate": "64k"},
+        {"name": "720p", "height": 720, "video_bitrate": "2500k", "audio_bitrate": "128k"},
+        {"name": "1080p", "height": 1080, "video_bitrate": "5000k", "audio_bitrate": "128k"},
+    ]
     
     # 抖音相关配置
     DOUYIN_API_TIMEOUT: int = 30
     MAX_RETRY_COUNT: int = 3
     RETRY_DELAY: List[int] = [60, 300, 900]  # 重试延迟：1分钟、5分钟、15分钟
+    RETRY_JITTER: float = 0.1  # 重试延迟的随机抖动比例（±10%）
+    DOUYIN_POST_CONCURRENCY: int = 8  # 单个发布任务内同时发布的账号数
+    # 限流状态在进程内存中，外部执行模式下只由一个工作进程领取发布任务（见 worker.py --no-post）
+    DOUYIN_ACCOUNT_RATE_PER_MINUTE: float = 6  # 每个账号每分钟最多发布次数
+    DOUYIN_ACCOUNT_BURST: int = 2  # 每个账号允许的突发发布次数
+
+    # 任务队列配置
+    TASK_DB_FILE: str = "data/tasks.db"  # 任务持久化存储，使用 WAL 模式，目录中还有 -wal/-shm 文件
+    TASK_STORE_FLUSH_INTERVAL: float = 0.5  # 任务状态批量写入间隔（秒）
+    HISTORY_FLUSH_INTERVAL: float = 2.0  # 发布历史记录批量写入间隔（秒）
+    TASK_EXECUTION_MODE: str = "embedded"  # embedded: API进程内执行任务；external: 由 worker.py 独立进程执行
+    TASK_LEASE_SECONDS: int = 60  # 工作进程领取任务的租约时长
+    TASK_HEARTBEAT_INTERVAL: int = 15  # 工作进程续约间隔
+    TASK_CLAIM_INTERVAL: float = 1.0  # 工作进程空闲时检查新任务的间隔
+    TASK_WORKER_COUNT: int = 36  # 工作协程数量
+    TASK_TYPE_CONCURRENCY: Dict[str, int] = {  # 每种任务类型的并发上限
+        "video_processing": 4,
+        "douyin_post": 32,
+    }
+    TASK_PRIORITY_CLASSES: List[str] = ["interactive", "bulk"]  # 优先级从高到低
+    TASK_USER_MAX_INFLIGHT: int = 0  # 每个用户同时执行的任务上限，0 表示不限制
+    TASK_USER_WEIGHTS: Dict[str, float] = {}  # 用户ID -> 公平调度权重，默认 1
 
     # AI服务API配置
     RUNWAY_API_KEY: str = ""
     COQUI_API_KEY: str = ""
     SADTALKER_API_KEY: str = ""
+    
+    # 调用AI服务的共享 HTTP 连接池
+    HTTP_MAX_CONNECTIONS: int = 100  # 连接池总连接数
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 16  # 每个服务商主机的并发连接数
+    HTTP_KEEPALIVE_TIMEOUT: float = 60  # 空闲连接保留时间（秒）
+    HTTP_DNS_CACHE_TTL: int = 300  # DNS 缓存时间（秒）
+    HTTP_CONNECT_TIMEOUT: float = 10  # 建立连接超时（秒）
+    HTTP_READ_TIMEOUT: float = 300  # 两次读到数据之间的最长等待（秒），AI处理较慢时需要调大
+    HTTP_TRANSFER_CHUNK_SIZE: int = 1024 * 1024  # 上传和下载文件时每次读写的块大小
+    
+    # 上传给AI服务前的代理转码：按服务商可用的最大分辨率（短边）和码率转码
+    AI_PROXY_ENABLED: bool = True
+    AI_PROXY_DIR: str = "uploads/proxies"
+    AI_PROXY_TIMEOUT: float = 600  # 单个视频转码超时时间（秒）
+    AI_PROXY_PROFILES: Dict[str, Dict[str, Any]] = {
+        "runway": {"max_side": 720, "video_bitrate": "2500k", "fps": 30, "audio_bitrate": "128k"},
+        "lipsync": {"max_side": 512, "video_bitrate": "1500k", "fps": 25, "audio_bitrate": "128k"},
+    }
+    
+    # 声音特征和合成语音缓存：内存 LRU + 磁盘，磁盘容量由 STORAGE_POLICIES 的 voice 项限制
+    VOICE_CACHE_ENABLED: bool = True
+    VOICE_CACHE_DIR: str = "uploads/voice_cache"
+    VOICE_CACHE_MEMORY_BYTES: int = 64 * 1024 * 1024  # 内存中缓存的特征和语音的总字节数
 
     model_config = {
         "case_sensitive": True,
@@ -76,17 +160,88 @@ class Settings(BaseSettings):
                         self.UPLOAD_DIR = config['upload'].get('dir', self.UPLOAD_DIR)
                         self.PREVIEW_DIR = config['upload'].get('preview_dir', self.PREVIEW_DIR)
                         self.MAX_UPLOAD_SIZE = config['upload'].get('max_size', self.MAX_UPLOAD_SIZE)
+                        self.UPLOAD_CHUNK_SIZE = config['upload'].get('chunk_size', self.UPLOAD_CHUNK_SIZE)
+                        self.BLOB_DIR = config['upload'].get('blob_dir', self.BLOB_DIR)
+                        self.UPLOAD_SESSION_DIR = config['upload'].get('session_dir', self.UPLOAD_SESSION_DIR)
+                        self.UPLOAD_SESSION_TTL = config['upload'].get('session_ttl', self.UPLOAD_SESSION_TTL)
+                        self.PROCESSED_DIR = config['upload'].get('processed_dir', self.PROCESSED_DIR)
+                    
+                    if config.get('storage'):
+                        self.STORAGE_SCAN_INTERVAL = config['storage'].get('scan_interval', self.STORAGE_SCAN_INTERVAL)
+                        self.STORAGE_FULL_SCAN_INTERVAL = config['storage'].get('full_scan_interval', self.STORAGE_FULL_SCAN_INTERVAL)
+                        self.STORAGE_ORPHAN_GRACE = config['storage'].get('orphan_grace', self.STORAGE_ORPHAN_GRACE)
+                        self.STORAGE_DELETE_UNTRACKED = config['storage'].get('delete_untracked', self.STORAGE_DELETE_UNTRACKED)
+                        self.STORAGE_USER_QUOTA = config['storage'].get('user_quota', self.STORAGE_USER_QUOTA)
+                        self.STORAGE_USER_QUOTAS = config['storage'].get('user_quotas', self.STORAGE_USER_QUOTAS)
+                        self.STORAGE_POLICIES = config['storage'].get('policies', self.STORAGE_POLICIES)
+                    
+                    if config.get('media'):
+                        self.MEDIA_WORKERS = config['media'].get('workers', self.MEDIA_WORKERS)
+                        self.MEDIA_COMMAND_TIMEOUT = config['media'].get('command_timeout', self.MEDIA_COMMAND_TIMEOUT)
+                        self.SPRITE_COLUMNS = config['media'].get('sprite_columns', self.SPRITE_COLUMNS)
+                        self.SPRITE_ROWS = config['media'].get('sprite_rows', self.SPRITE_ROWS)
+                        self.SPRITE_TILE_WIDTH = config['media'].get('sprite_tile_width', self.SPRITE_TILE_WIDTH)
+                    
+                    if config.get('hls'):
+                        self.HLS_ENABLED = config['hls'].get('enabled', self.HLS_ENABLED)
+                        self.HLS_DIR = config['hls'].get('dir', self.HLS_DIR)
+                        self.HLS_WORKERS = config['hls'].get('workers', self.HLS_WORKERS)
+                        self.HLS_THREADS = config['hls'].get('threads', self.HLS_THREADS)
+                        self.HLS_TIMEOUT = config['hls'].get('timeout', self.HLS_TIMEOUT)
+                        self.HLS_SEGMENT_SECONDS = config['hls'].get('segment_seconds', self.HLS_SEGMENT_SECONDS)
+                        self.HLS_LADDER = config['hls'].get('ladder', self.HLS_LADDER)
                     
                     if config.get('douyin'):
                         self.DOUYIN_API_TIMEOUT = config['douyin'].get('api_timeout', self.DOUYIN_API_TIMEOUT)
                         self.MAX_RETRY_COUNT = config['douyin'].get('max_retry_count', self.MAX_RETRY_COUNT)
                         self.RETRY_DELAY = config['douyin'].get('retry_delay', self.RETRY_DELAY)
+                        self.RETRY_JITTER = config['douyin'].get('retry_jitter', self.RETRY_JITTER)
+                        self.DOUYIN_POST_CONCURRENCY = config['douyin'].get('post_concurrency', self.DOUYIN_POST_CONCURRENCY)
+                        self.DOUYIN_ACCOUNT_RATE_PER_MINUTE = config['douyin'].get('account_rate_per_minute', self.DOUYIN_ACCOUNT_RATE_PER_MINUTE)
+                        self.DOUYIN_ACCOUNT_BURST = config['douyin'].get('account_burst', self.DOUYIN_ACCOUNT_BURST)
+                    
+                    if config.get('task_queue'):
+                        self.TASK_DB_FILE = config['task_queue'].get('db_file', self.TASK_DB_FILE)
+                        self.TASK_STORE_FLUSH_INTERVAL = config['task_queue'].get('flush_interval', self.TASK_STORE_FLUSH_INTERVAL)
+                        self.HISTORY_FLUSH_INTERVAL = config['task_queue'].get('history_flush_interval', self.HISTORY_FLUSH_INTERVAL)
+                        self.TASK_EXECUTION_MODE = config['task_queue'].get('execution_mode', self.TASK_EXECUTION_MODE)
+                        self.TASK_LEASE_SECONDS = config['task_queue'].get('lease_seconds', self.TASK_LEASE_SECONDS)
+                        self.TASK_HEARTBEAT_INTERVAL = config['task_queue'].get('heartbeat_interval', self.TASK_HEARTBEAT_INTERVAL)
+                        self.TASK_CLAIM_INTERVAL = config['task_queue'].get('claim_interval', self.TASK_CLAIM_INTERVAL)
+                        self.TASK_WORKER_COUNT = config['task_queue'].get('workers', self.TASK_WORKER_COUNT)
+                        self.TASK_TYPE_CONCURRENCY = config['task_queue'].get('type_concurrency', self.TASK_TYPE_CONCURRENCY)
+                        self.TASK_PRIORITY_CLASSES = config['task_queue'].get('priority_classes', self.TASK_PRIORITY_CLASSES)
+                        self.TASK_USER_MAX_INFLIGHT = config['task_queue'].get('user_max_inflight', self.TASK_USER_MAX_INFLIGHT)
+                        self.TASK_USER_WEIGHTS = {
+                            str(user_id): weight
+                            for user_id, weight in (config['task_queue'].get('user_weights') or self.TASK_USER_WEIGHTS).items()
+                        }
                     
                     if config.get('ai_services'):
                         self.RUNWAY_API_KEY = config['ai_services'].get('runway_api_key', self.RUNWAY_API_KEY)
                         self.COQUI_API_KEY = config['ai_services'].get('coqui_api_key', self.COQUI_API_KEY)
                         self.SADTALKER_API_KEY = config['ai_services'].get('sadtalker_api_key', self.SADTALKER_API_KEY)
                     
+                    if config.get('http_client'):
+                        self.HTTP_MAX_CONNECTIONS = config['http_client'].get('max_connections', self.HTTP_MAX_CONNECTIONS)
+                        self.HTTP_MAX_CONNECTIONS_PER_HOST = config['http_client'].get('max_connections_per_host', self.HTTP_MAX_CONNECTIONS_PER_HOST)
+                        self.HTTP_KEEPALIVE_TIMEOUT = config['http_client'].get('keepalive_timeout', self.HTTP_KEEPALIVE_TIMEOUT)
+                        self.HTTP_DNS_CACHE_TTL = config['http_client'].get('dns_cache_ttl', self.HTTP_DNS_CACHE_TTL)
+                        self.HTTP_CONNECT_TIMEOUT = config['http_client'].get('connect_timeout', self.HTTP_CONNECT_TIMEOUT)
+                        self.HTTP_READ_TIMEOUT = config['http_client'].get('read_timeout', self.HTTP_READ_TIMEOUT)
+                        self.HTTP_TRANSFER_CHUNK_SIZE = config['http_client'].get('transfer_chunk_size', self.HTTP_TRANSFER_CHUNK_SIZE)
+                    
+                    if config.get('ai_proxy'):
+                        self.AI_PROXY_ENABLED = config['ai_proxy'].get('enabled', self.AI_PROXY_ENABLED)
+                        self.AI_PROXY_DIR = config['ai_proxy'].get('dir', self.AI_PROXY_DIR)
+                        self.AI_PROXY_TIMEOUT = config['ai_proxy'].get('timeout', self.AI_PROXY_TIMEOUT)
+                        self.AI_PROXY_PROFILES = config['ai_proxy'].get('profiles', self.AI_PROXY_PROFILES)
+                    
+                    if config.get('voice_cache'):
+                        self.VOICE_CACHE_ENABLED = config['voice_cache'].get('enabled', self.VOICE_CACHE_ENABLED)
+                        self.VOICE_CACHE_DIR = config['voice_cache'].get('dir', self.VOICE_CACHE_DIR)
+                        self.VOICE_CACHE_MEMORY_BYTES = config['voice_cache'].get('memory_bytes', self.VOICE_CACHE_MEMORY_BYTES)
+                    
                     # 确保目录存在
                     os.makedirs(self.UPLOAD_DIR, exist_ok=True)
                     os.makedirs(self.PREVIEW_DIR, exist_ok=True)
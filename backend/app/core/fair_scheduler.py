@@ -0,0 +1,145 @@
+import itertools
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, Hashable, List, Optional, Tuple
+
+class FairScheduler:
+    """多用户公平调度的就绪队列
+
+    - 优先级类别按顺序严格优先，例如交互类任务总是先于批量任务
+    - 同一优先级内，每个用户一个子队列，按赤字轮转（DRR）服务，
+      用户权重越大，每轮可以领取的任务越多
+    - 任务类型并发上限、用户在途任务上限都满足时任务才会被领取；
+      其他用户没有任务时，单个用户可以用满所有空闲工作协程
+    """
+
+    def __init__(self, priorities: List[str], type_limits: Dict[str, int], default_limit: int,
+                 user_max_inflight: int = 0, user_weights: Optional[Dict[str, float]] = None):
+        self.priorities = list(priorities)
+        self.type_limits = type_limits
+        self.default_limit = default_limit
+        self.user_max_inflight = user_max_inflight  # 0 表示不限制
+        self.user_weights = user_weights or {}
+        # 优先级 -> 用户 -> 任务类型 -> [(入队序号, 入队时间, 任务)]
+        self.ready: Dict[str, Dict[Hashable, Dict[str, Deque[Tuple[int, float, object]]]]] = {
+            priority: {} for priority in self.priorities
+        }
+        # 每个优先级中有就绪任务的用户，队首为当前轮到的用户
+        self.turns: Dict[str, Deque[Hashable]] = {priority: deque() for priority in self.priorities}
+        self.deficit: Dict[Hashable, float] = defaultdict(float)
+        self.running_by_type: Dict[str, int] = defaultdict(int)
+        self.running_by_user: Dict[Hashable, int] = defaultdict(int)
+        self.seq = itertools.count()
+        self.wait_samples: Deque[float] = deque(maxlen=1024)  # 最近任务的排队等待时间（秒）
+
+    def type_limit(self, task_type: str) -> int:
+        return self.type_limits.get(task_type) or self.default_limit
+
+    def user_weight(self, user_id: Hashable) -> float:
+        return max(float(self.user_weights.get(str(user_id), 1)), 0.01)
+
+    def _priority_of(self, task) -> str:
+        priority = getattr(task, "priority", None)
+        return priority if priority in self.ready else self.priorities[-1]
+
+    def push(self, task):
+        priority = self._priority_of(task)
+        users = self.ready[priority]
+        user_id = task.user_id
+        if user_id not in users:
+            users[user_id] = {}
+            self.turns[priority].append(user_id)
+        users[user_id].setdefault(task.task_type, deque()).append(
+            (next(self.seq), time.monotonic(), task)
+        )
+
+    def _user_available(self, user_id: Hashable) -> bool:
+        return not self.user_max_inflight or self.running_by_user[user_id] < self.user_max_inflight
+
+    def _first_eligible_type(self, queues: Dict[str, Deque]) -> Optional[str]:
+        """用户子队列中类型仍有并发额度的最早任务所属类型"""
+        best_type = None
+        best_seq = None
+        for task_type, queue in queues.items():
+            if self.running_by_type[task_type] >= self.type_limit(task_type):
+                continue
+            seq = queue[0][0]
+            if best_seq is None or seq < best_seq:
+                best_type, best_seq = task_type, seq
+        return best_type
+
+    def pop(self):
+        """按优先级和赤字轮转选出下一个可以执行的任务，没有则返回 None"""
+        for priority in self.priorities:
+            turns = self.turns[priority]
+            users = self.ready[priority]
+            idle_visits = 0
+            # 连续一整轮都没有可执行任务时，说明该优先级暂时无法调度
+            while turns and idle_visits < len(turns):
+                user_id = turns[0]
+                task_type = None
+                if self._user_available(user_id):
+                    task_type = self._first_eligible_type(users[user_id])
+                if task_type is None:
+                    turns.rotate(-1)
+                    idle_visits += 1
+                    continue
+
+                if self.deficit[user_id] < 1:
+                    # 新的一轮：按权重补充配额，配额不足一个任务时轮到下一个用户
+                    self.deficit[user_id] += self.user_weight(user_id)
+                    if self.deficit[user_id] < 1:
+                        turns.rotate(-1)
+                        idle_visits = 0
+                        continue
+
+                self.deficit[user_id] -= 1
+                queues = users[user_id]
+                _, enqueued_at, task = queues[task_type].popleft()
+                if not queues[task_type]:
+                    del queues[task_type]
+                if not queues:
+                    # 用户没有剩余任务时离开轮转，清空配额
+                    del users[user_id]
+                    turns.popleft()
+                    self.deficit.pop(user_id, None)
+                elif self.deficit[user_id] < 1:
+                    turns.rotate(-1)
+
+                self.running_by_type[task.task_type] += 1
+                self.running_by_user[user_id] += 1
+                self.wait_samples.append(time.monotonic() - enqueued_at)
+                return task
+        return None
+
+    def release(self, task):
+        self.running_by_type[task.task_type] -= 1
+        self.running_by_user[task.user_id] -= 1
+        if self.running_by_user[task.user_id] <= 0:
+            del self.running_by_user[task.user_id]
+
+    def stats(self) -> dict:
+        queued_by_type: Dict[str, int] = defaultdict(int)
+        queued_by_priority: Dict[str, int] = {}
+        queued_users = set()
+        for priority, users in self.ready.items():
+            count = 0
+            for user_id, queues in users.items():
+                queued_users.add(user_id)
+                for task_type, queue in queues.items():
+                    queued_by_type[task_type] += len(queue)
+                    count += len(queue)
+            if count:
+                queued_by_priority[priority] = count
+
+        waits = sorted(self.wait_samples)
+        return {
+            "queued": dict(queued_by_type),
+            "queued_total": sum(queued_by_type.values()),
+            "queued_by_priority": queued_by_priority,
+            "queued_users": len(queued_users),
+            "running": {t: n for t, n in self.running_by_type.items() if n},
+            "running_users": len(self.running_by_user),
+            "queue_wait_p50": waits[len(waits) // 2] if waits else None,
+            "queue_wait_p95": waits[int(len(waits) * 0.95)] if waits else None,
+        }
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import Any, Dict
+
+from sqlalchemy import update, bindparam
+
+from app.db.database import sync_engine
+from app.models.post_history import PostHistory
+
+logger = logging.getLogger(__name__)
+
+class HistoryWriter:
+    """任务历史记录的延迟批量写入
+
+    同一任务在一个刷新周期内的多次状态、进度变化只保留最后一次，
+    由后台协程定期在线程池中以单个事务写入数据库。
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def mark(self, task) -> None:
+        """记录任务当前状态，等待下次批量写入"""
+        if task.task_type != "douyin_post":
+            return
+        failed_accounts = task.result.get("failed_accounts", []) if task.result else []
+        self._pending[task.task_id] = {
+            "b_task_id": task.task_id,
+            "status": task.status,
+            "success_count": task.result.get("success_count", 0) if task.result else 0,
+            "failed_count": len(failed_accounts),
+            "failed_accounts": list(failed_accounts),
+            "updated_at": task.updated_at,
+            "retries": task.retry_count
+        }
+
+    def _write(self, updates: Dict[str, Dict[str, Any]]) -> None:
+        # 每个任务只更新自己的一行，所有任务在一个事务中批量执行
+        stmt = (
+            update(PostHistory.__table__)
+            .where(PostHistory.__table__.c.task_id == bindparam("b_task_id"))
+            .values(
+                status=bindparam("status"),
+                success_count=bindparam("success_count"),
+                failed_count=bindparam("failed_count"),
+                failed_accounts=bindparam("failed_accounts"),
+                updated_at=bindparam("updated_at"),
+                retries=bindparam("retries")
+            )
+        )
+        with sync_engine.begin() as conn:
+            conn.execute(stmt, list(updates.values()))
+
+    async def flush(self) -> None:
+        """立即写入所有待写入的记录"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            updates, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write, updates)
+            except Exception as e:
+                logger.error(f"Error flushing history for {len(updates)} tasks: {e}")
+                for task_id, pending in updates.items():
+                    self._pending.setdefault(task_id, pending)
+
+    async def run(self) -> None:
+        """后台批量写入循环"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
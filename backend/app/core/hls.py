@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+from typing import Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.core.media import Coalescer, MediaCommandError, MediaExecutor
+
+logger = logging.getLogger(__name__)
+
+HLS_MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+}
+
+class HlsPackager:
+    """把处理后的视频转成多码率 HLS，供审核时预览
+
+    输出目录按视频内容的 SHA-256 命名，内容不变则播放列表和分片不变，
+    可以长期缓存；先写入临时目录，完成后整体重命名，目录存在即表示可以播放。
+    转码在独立的、并发数很小的 ffmpeg 进程池中以低优先级运行，不影响AI处理流程。
+    """
+
+    def __init__(self, executor: MediaExecutor, root: str, ladder: List[Dict],
+                 segment_seconds: int, threads: int):
+        self.executor = executor
+        self.root = root
+        self.ladder = sorted(ladder, key=lambda rung: rung["height"])
+        self.segment_seconds = segment_seconds
+        self.threads = threads
+        self._coalescer = Coalescer()
+        self._background: Set[asyncio.Task] = set()
+
+    def output_dir(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256)
+
+    def is_ready(self, sha256: str) -> bool:
+        return os.path.isfile(os.path.join(self.output_dir(sha256), "master.m3u8"))
+
+    def select_ladder(self, metadata: dict) -> List[Dict]:
+        """不超过源视频分辨率（短边）的码率档位，源视频低于最低档时只保留最低档"""
+        sides = [side for side in (metadata.get("width"), metadata.get("height")) if side]
+        short_side = min(sides) if sides else None
+        rungs = [rung for rung in self.ladder if not short_side or rung["height"] <= short_side]
+        return rungs or self.ladder[:1]
+
+    def build_command(self, input_path: str, output_dir: str, rungs: List[Dict],
+                      has_audio: bool, portrait: bool) -> List[str]:
+        count = len(rungs)
+        # 竖屏视频按宽度缩放，保证短边等于档位高度
+        scale = "scale={}:-2" if portrait else "scale=-2:{}"
+        filters = [f"[0:v]split={count}" + "".join(f"[v{i}]" for i in range(count))]
+        filters += [f"[v{i}]{scale.format(rung['height'])}[v{i}out]" for i, rung in enumerate(rungs)]
+
+        args = ["ffmpeg", "-v", "error", "-y", "-i", input_path,
+                "-filter_complex", ";".join(filters)]
+        for i, rung in enumerate(rungs):
+            args += [
+                "-map", f"[v{i}out]",
+                f"-c:v:{i}", "libx264",
+                f"-b:v:{i}", rung["video_bitrate"],
+                f"-maxrate:v:{i}", rung["video_bitrate"],
+                f"-bufsize:v:{i}", rung["video_bitrate"],
+            ]
+        if has_audio:
+            for i, rung in enumerate(rungs):
+                args += ["-map", "0:a:0", f"-c:a:{i}", "aac", f"-b:a:{i}", rung.get("audio_bitrate", "128k")]
+        stream_map = " ".join(
+            f"v:{i},a:{i},name:{rung['name']}" if has_audio else f"v:{i},name:{rung['name']}"
+            for i, rung in enumerate(rungs)
+        )
+        args += [
+            "-preset", "veryfast",
+            "-threads", str(self.threads),
+            # 固定关键帧间隔，各档位分片边界对齐，便于播放器切换码率
+            "-force_key_frames", f"expr:gte(t,n_forced*{self.segment_seconds})",
+            "-sc_threshold", "0",
+            "-f", "hls",
+            "-hls_time", str(self.segment_seconds),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_filename", os.path.join(output_dir, "%v", "seg_%05d.ts"),
+            "-master_pl_name", "master.m3u8",
+            "-var_stream_map", stream_map,
+            os.path.join(output_dir, "%v", "index.m3u8"),
+        ]
+        if shutil.which("nice"):
+            args = ["nice", "-n", "10"] + args
+        return args
+
+    async def _package(self, input_path: str, sha256: str, metadata: dict):
+        if self.is_ready(sha256):
+            return
+        output_dir = self.output_dir(sha256)
+        tmp_dir = f"{output_dir}.{uuid.uuid4().hex}.tmp"
+        rungs = self.select_ladder(metadata)
+        portrait = (metadata.get("height") or 0) > (metadata.get("width") or 0)
+        try:
+            for rung in rungs:
+                os.makedirs(os.path.join(tmp_dir, rung["name"]), exist_ok=True)
+            await self.executor.run(*self.build_command(
+                input_path, tmp_dir, rungs, bool(metadata.get("audio_codec")), portrait
+            ))
+            if not os.path.isfile(os.path.join(tmp_dir, "master.m3u8")):
+                raise MediaCommandError("ffmpeg produced no master playlist")
+            try:
+                os.rename(tmp_dir, output_dir)
+            except OSError:
+                # 其他进程已经生成了相同内容的 HLS
+                if not self.is_ready(sha256):
+                    raise
+            logger.info(f"Packaged HLS for {sha256} with {[rung['name'] for rung in rungs]}")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    async def package(self, input_path: str, sha256: str, metadata: Optional[dict]) -> bool:
+        """生成 HLS，返回是否成功；同一内容的并发请求只转码一次"""
+        if not metadata or not metadata.get("video_codec"):
+            logger.warning(f"Skipping HLS for {input_path}: no video metadata")
+            return False
+        try:
+            await self._coalescer.run(sha256, lambda: self._package(input_path, sha256, metadata))
+            return True
+        except (MediaCommandError, OSError) as e:
+            logger.error(f"Failed to package HLS for {input_path}: {e}")
+            return False
+
+    def schedule(self, input_path: str, sha256: str, metadata: Optional[dict]):
+        """在后台生成 HLS，不阻塞调用方"""
+        if self.is_ready(sha256):
+            return
+        task = asyncio.create_task(self.package(input_path, sha256, metadata))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+# HLS 转码使用独立的进程池，与上传、预览等媒体命令互不占用
+hls_executor = MediaExecutor(settings.HLS_WORKERS, settings.HLS_TIMEOUT)
+hls_packager = HlsPackager(
+    hls_executor, settings.HLS_DIR, settings.HLS_LADDER,
+    settings.HLS_SEGMENT_SECONDS, settings.HLS_THREADS
+)
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import ssl
+from typing import List, Optional
+
+import aiohttp
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class HttpClient:
+    """应用级共享的 HTTP 客户端
+
+    所有AI服务共用一个连接池：连接保持复用（keep-alive），DNS 结果缓存，
+    按主机限制并发连接数，避免每次调用都重新做 TCP/TLS 握手和 DNS 查询。
+    会话在首次使用时创建，与创建时的事件循环绑定，由 FastAPI 或工作进程退出时关闭。
+    """
+
+    def __init__(self, ssl_context: Optional[ssl.SSLContext] = None,
+                 trace_configs: Optional[List[aiohttp.TraceConfig]] = None):
+        self.ssl_context = ssl_context
+        self.trace_configs = trace_configs
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_MAX_CONNECTIONS,
+            limit_per_host=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+            ssl=self.ssl_context if self.ssl_context is not None else True,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            sock_read=settings.HTTP_READ_TIMEOUT,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=self.trace_configs)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = self._create_session()
+            self._loop = loop
+        return self._session
+
+    async def start(self):
+        """应用启动时创建连接池"""
+        _ = self.session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+# 全局 HTTP 客户端
+http_client = HttpClient()
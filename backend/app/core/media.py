@@ -0,0 +1,227 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 访问时间的记录精度，同一文件一小时内只更新一次
+ACCESS_RESOLUTION = 3600
+
+class MediaCommandError(Exception):
+    """ffmpeg/ffprobe 执行失败"""
+
+class MediaExecutor:
+    """异步执行 ffmpeg/ffprobe 子进程，限制同时运行的进程数量"""
+
+    def __init__(self, max_workers: int, timeout: float):
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_workers)
+
+    async def run(self, *args: str, timeout: Optional[float] = None) -> bytes:
+        """执行命令并返回标准输出，失败或超时时抛出 MediaCommandError"""
+        async with self._semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(), timeout or self.timeout
+                )
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise MediaCommandError(f"{args[0]} timed out")
+            except asyncio.CancelledError:
+                process.kill()
+                raise
+            if process.returncode != 0:
+                raise MediaCommandError(
+                    f"{args[0]} exited with {process.returncode}: {stderr.decode(errors='replace')[-500:]}"
+                )
+            return stdout
+
+class Coalescer:
+    """相同 key 的并发调用共享同一次执行结果"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def run(self, key: str, factory):
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(factory())
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+def file_identity(path: str) -> str:
+    """按 inode、大小和修改时间标识文件内容，硬链接到同一内容的文件标识相同"""
+    st = os.stat(path)
+    return f"{st.st_dev:x}-{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+def touch_access(path: str):
+    """记录缓存文件被使用，空间管理按访问时间淘汰；不依赖文件系统的 atime 挂载选项，修改时间保持不变"""
+    try:
+        st = os.stat(path)
+        if time.time() - st.st_atime >= ACCESS_RESOLUTION:
+            os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+    except OSError:
+        pass
+
+class ThumbnailCache:
+    """视频预览图和拖动预览雪碧图缓存
+
+    文件按视频的文件标识命名，视频未变化时直接命中；
+    同一文件的并发请求只会启动一次 ffmpeg。
+    """
+
+    def __init__(self, executor: MediaExecutor, preview_dir: str):
+        self.executor = executor
+        self.preview_dir = preview_dir
+        self._coalescer = Coalescer()
+
+    def preview_path(self, identity: str) -> str:
+        return os.path.join(self.preview_dir, f"{identity}.jpg")
+
+    async def _render(self, video_path: str, preview_path: str):
+        os.makedirs(self.preview_dir, exist_ok=True)
+        tmp_path = f"{preview_path}.{uuid.uuid4().hex}.jpg"
+        try:
+            # 优先取第1秒的画面，视频不足1秒时取第一帧
+            for seek in ("00:00:01", "00:00:00"):
+                await self.executor.run(
+                    "ffmpeg", "-v", "error", "-y", "-ss", seek, "-i", video_path,
+                    "-frames:v", "1", tmp_path
+                )
+                if os.path.exists(tmp_path) and os.path.getsize(tmp_path) > 0:
+                    os.replace(tmp_path, preview_path)
+                    return
+            raise MediaCommandError("ffmpeg produced no frame")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def get_preview(self, video_path: str) -> str:
+        """返回预览图路径，缓存未命中时生成"""
+        identity = file_identity(video_path)
+        preview_path = self.preview_path(identity)
+        if os.path.exists(preview_path):
+            touch_access(preview_path)
+        else:
+            await self._coalescer.run(f"preview:{identity}", lambda: self._render(video_path, preview_path))
+        return preview_path
+
+    def sprite_paths(self, identity: str) -> Tuple[str, str, str]:
+        """雪碧图、WebVTT 和 JSON 索引的路径"""
+        base = os.path.join(self.preview_dir, f"{identity}_sprite")
+        return f"{base}.jpg", f"{base}.vtt", f"{base}.json"
+
+    def _sprite_layout(self, metadata: Optional[dict]) -> dict:
+        metadata = metadata or {}
+        columns, rows = settings.SPRITE_COLUMNS, settings.SPRITE_ROWS
+        duration = metadata.get("duration") or 0
+        # 长视频均匀取满网格，短视频每秒一帧；时长未知时按每秒一帧取满网格
+        interval = max(duration / (columns * rows), 1.0) if duration else 1.0
+        count = min(columns * rows, max(math.ceil(duration / interval), 1)) if duration else columns * rows
+        width = settings.SPRITE_TILE_WIDTH
+        if metadata.get("width") and metadata.get("height"):
+            height = max(round(width * metadata["height"] / metadata["width"] / 2) * 2, 2)
+        else:
+            height = round(width * 9 / 16 / 2) * 2
+        return {
+            "columns": columns,
+            "rows": math.ceil(count / columns),
+            "tile_width": width,
+            "tile_height": height,
+            "interval": interval,
+            "duration": duration or count * interval,
+            "count": count,
+        }
+
+    @staticmethod
+    def _vtt_time(seconds: float) -> str:
+        hours, rest = divmod(seconds, 3600)
+        minutes, seconds = divmod(rest, 60)
+        return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+    async def _render_sprite(self, video_path: str, identity: str, layout: dict):
+        sprite_path, vtt_path, index_path = self.sprite_paths(identity)
+        os.makedirs(self.preview_dir, exist_ok=True)
+        suffix = uuid.uuid4().hex
+        tmp_sprite = f"{sprite_path}.{suffix}.jpg"
+        try:
+            # 一次解码：按间隔取帧、缩放后拼接成 columns x rows 的网格图
+            await self.executor.run(
+                "ffmpeg", "-v", "error", "-y", "-i", video_path,
+                "-vf", (
+                    f"fps=1/{layout['interval']:.3f},"
+                    f"scale={layout['tile_width']}:{layout['tile_height']},"
+                    f"tile={layout['columns']}x{layout['rows']}"
+                ),
+                "-frames:v", "1", "-q:v", "5", tmp_sprite
+            )
+            if not os.path.exists(tmp_sprite) or os.path.getsize(tmp_sprite) == 0:
+                raise MediaCommandError("ffmpeg produced no sprite")
+
+            sprite_name = os.path.basename(sprite_path)
+            cues = []
+            for i in range(layout["count"]):
+                start = i * layout["interval"]
+                end = min((i + 1) * layout["interval"], layout["duration"])
+                x = (i % layout["columns"]) * layout["tile_width"]
+                y = (i // layout["columns"]) * layout["tile_height"]
+                cues.append({"start": round(start, 3), "end": round(end, 3), "x": x, "y": y})
+            vtt = ["WEBVTT", ""]
+            for cue in cues:
+                vtt += [
+                    f"{self._vtt_time(cue['start'])} --> {self._vtt_time(cue['end'])}",
+                    f"{sprite_name}#xywh={cue['x']},{cue['y']},{layout['tile_width']},{layout['tile_height']}",
+                    ""
+                ]
+            index = {**layout, "sprite": sprite_name, "vtt": os.path.basename(vtt_path), "cues": cues}
+
+            for path, content in ((vtt_path, "\n".join(vtt)), (index_path, json.dumps(index))):
+                with open(f"{path}.{suffix}", "w", encoding="utf-8") as f:
+                    f.write(content)
+            # 索引最后写入，索引存在即表示雪碧图和 WebVTT 已经生成
+            os.replace(tmp_sprite, sprite_path)
+            os.replace(f"{vtt_path}.{suffix}", vtt_path)
+            os.replace(f"{index_path}.{suffix}", index_path)
+        finally:
+            for path in (tmp_sprite, f"{vtt_path}.{suffix}", f"{index_path}.{suffix}"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    async def get_sprite(self, video_path: str, metadata: Optional[dict]) -> dict:
+        """返回拖动预览用的雪碧图索引，首次请求时生成"""
+        identity = file_identity(video_path)
+        index_path = self.sprite_paths(identity)[2]
+        if os.path.exists(index_path):
+            touch_access(index_path)
+        else:
+            layout = self._sprite_layout(metadata)
+            await self._coalescer.run(
+                f"sprite:{identity}", lambda: self._render_sprite(video_path, identity, layout)
+            )
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+async def probe(path: str) -> dict:
+    """一次 ffprobe 调用获取容器和所有流的信息"""
+    output = await media_executor.run(
+        "ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path
+    )
+    return json.loads(output)
+
+# 全局媒体处理执行器和预览图缓存
+media_executor = MediaExecutor(settings.MEDIA_WORKERS, settings.MEDIA_COMMAND_TIMEOUT)
+thumbnails = ThumbnailCache(media_executor, settings.PREVIEW_DIR)
@@ -0,0 +1,153 @@
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import aiofiles
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+
+def _etag(st: os.stat_result) -> str:
+    # 硬链接到同一内容的文件共享 inode，ETag 也相同
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """解析单个字节区间，返回闭区间 (start, end)
+
+    格式错误或包含多个区间时返回 None（按完整文件响应），
+    区间不可满足时抛出 ValueError。
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, sep, end_text = spec.strip().partition("-")
+    if not sep or (start_text and not start_text.isdigit()) or (end_text and not end_text.isdigit()):
+        return None
+    if not start_text:
+        # bytes=-N 表示最后 N 个字节
+        if not end_text:
+            return None
+        length = int(end_text)
+        if length == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else None
+    if end is not None and end < start:
+        return None
+    if start >= size:
+        raise ValueError("unsatisfiable range")
+    return start, size - 1 if end is None else min(end, size - 1)
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _if_range_matches(request: Request, etag: str, last_modified: str) -> bool:
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    return if_range.strip() in (etag, last_modified)
+
+class MediaFileResponse(Response):
+    """支持 Range、条件请求和零拷贝发送的文件响应
+
+    服务器支持 ASGI 的 http.response.zerocopy / pathsend 扩展时由服务器直接发送文件，
+    否则按固定大小分块读取，内存占用与文件大小无关。
+    """
+
+    def __init__(self, request: Request, path: str, media_type: Optional[str] = None,
+                 filename: Optional[str] = None):
+        self.path = path
+        self.media_type = media_type or "application/octet-stream"
+        self.background = None
+        self.send_body = request.method != "HEAD"
+
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            raise FileNotFoundError(path)
+        size = st.st_size
+        etag = _etag(st)
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+        }
+        if filename:
+            headers["content-disposition"] = f"inline; filename*=utf-8''{quote(filename)}"
+
+        self.start, self.end = 0, size - 1
+        if _not_modified(request, etag, st.st_mtime):
+            self.status_code = 304
+            self.start, self.end = 0, -1
+        else:
+            self.status_code = 200
+            range_header = request.headers.get("range")
+            if range_header and _if_range_matches(request, etag, last_modified):
+                try:
+                    byte_range = _parse_range(range_header, size)
+                except ValueError:
+                    byte_range = None
+                    self.status_code = 416
+                    self.start, self.end = 0, -1
+                    headers["content-range"] = f"bytes */{size}"
+                if byte_range is not None:
+                    self.status_code = 206
+                    self.start, self.end = byte_range
+                    headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+            headers["content-type"] = self.media_type
+            headers["content-length"] = str(self.end - self.start + 1)
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        count = self.end - self.start + 1
+        if not self.send_body or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopy" in extensions:
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": f,
+                    "offset": self.start,
+                    "count": count,
+                    "more_body": False,
+                })
+            return
+        if "http.response.pathsend" in extensions and self.status_code == 200:
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            return
+
+        async with aiofiles.open(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # 文件在发送过程中被截断
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict
+
+import ffmpeg
+
+from app.core.config import settings
+from app.core.media import Coalescer, MediaExecutor, media_executor, touch_access
+
+logger = logging.getLogger(__name__)
+
+class ProxyTranscoder:
+    """上传给远程AI服务之前，把视频转成服务商可用的最大分辨率和码率
+
+    代理文件按 (源视频哈希, 转码参数) 缓存，同一视频重复处理时直接复用；
+    转码后反而更大时记录下来，之后直接上传原视频。
+    """
+
+    def __init__(self, executor: MediaExecutor, root: str, profiles: Dict[str, Dict]):
+        self.executor = executor
+        self.root = root
+        self.profiles = profiles
+        self._coalescer = Coalescer()
+
+    def _cache_key(self, sha256: str, profile: Dict) -> str:
+        params = hashlib.sha256(json.dumps(profile, sort_keys=True).encode()).hexdigest()[:12]
+        return f"{sha256}_{params}"
+
+    def build_command(self, input_path: str, output_path: str, profile: Dict) -> list:
+        # 短边不超过 max_side，不放大；-2 保持宽高比并取偶数
+        side = profile["max_side"]
+        stream = ffmpeg.input(input_path)
+        video = stream.video.filter(
+            "scale",
+            f"if(lt(iw,ih),trunc(min(iw,{side})/2)*2,-2)",
+            f"if(lt(iw,ih),-2,trunc(min(ih,{side})/2)*2)"
+        )
+        if profile.get("fps"):
+            video = video.filter("fps", fps=profile["fps"], round="down")
+        output_args = {
+            "vcodec": "libx264",
+            "preset": profile.get("preset", "veryfast"),
+            "video_bitrate": profile["video_bitrate"],
+            "maxrate": profile["video_bitrate"],
+            "bufsize": profile["video_bitrate"],
+            "movflags": "+faststart",
+            "loglevel": "error",
+        }
+        streams = [video]
+        if profile.get("keep_audio", True):
+            # 源视频没有音轨时可选映射不会报错
+            streams.append(stream["a?"])
+            output_args.update(acodec="aac", audio_bitrate=profile.get("audio_bitrate", "128k"))
+        return ffmpeg.output(*streams, output_path, **output_args).overwrite_output().compile()
+
+    async def _transcode(self, input_path: str, output_path: str, stats_path: str, profile: Dict):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{output_path}.{uuid.uuid4().hex}.mp4"
+        started = time.monotonic()
+        try:
+            await self.executor.run(
+                *self.build_command(input_path, tmp_path, profile), timeout=settings.AI_PROXY_TIMEOUT
+            )
+            source_size = os.path.getsize(input_path)
+            proxy_size = os.path.getsize(tmp_path)
+            use_source = proxy_size >= source_size
+            if not use_source:
+                os.replace(tmp_path, output_path)
+            stats = {
+                "source_size": source_size,
+                "proxy_size": source_size if use_source else proxy_size,
+                "use_source": use_source,
+                "transcode_seconds": round(time.monotonic() - started, 3),
+            }
+            # 统计文件最后写入，存在即表示缓存可用
+            with open(f"{stats_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(stats, f)
+            os.replace(f"{stats_path}.tmp", stats_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def prepare(self, input_path: str, sha256: str, profile_name: str) -> Dict:
+        """返回上传给服务商的文件路径及转码统计
+
+        未配置该服务商或转码失败时返回原视频，不影响后续处理。
+        """
+        started = time.monotonic()
+        source_size = os.path.getsize(input_path)
+        result = {
+            "path": input_path,
+            "source_size": source_size,
+            "proxy_size": source_size,
+            "bytes_saved": 0,
+            "cached": False,
+        }
+        profile = self.profiles.get(profile_name)
+        if not settings.AI_PROXY_ENABLED or not profile:
+            result["seconds"] = 0.0
+            return result
+
+        key = self._cache_key(sha256, profile)
+        output_path = os.path.join(self.root, f"{key}.mp4")
+        stats_path = os.path.join(self.root, f"{key}.json")
+        result["cached"] = os.path.exists(stats_path)
+        try:
+            if result["cached"]:
+                touch_access(stats_path)
+            else:
+                await self._coalescer.run(
+                    key, lambda: self._transcode(input_path, output_path, stats_path, profile)
+                )
+            with open(stats_path, "r", encoding="utf-8") as f:
+                stats = json.load(f)
+            if not stats["use_source"] and os.path.exists(output_path):
+                result.update(
+                    path=output_path,
+                    proxy_size=stats["proxy_size"],
+                    bytes_saved=source_size - stats["proxy_size"]
+                )
+        except Exception as e:
+            logger.warning(f"Proxy transcode for {profile_name} failed, uploading original: {e}")
+        result["seconds"] = round(time.monotonic() - started, 3)
+        return result
+
+# 全局代理转码器，与预览等媒体命令共用进程池
+proxy_transcoder = ProxyTranscoder(media_executor, settings.AI_PROXY_DIR, settings.AI_PROXY_PROFILES)
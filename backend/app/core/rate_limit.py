@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import Dict, Hashable
+
+class TokenBucket:
+    """令牌桶限流器：按固定速率补充令牌，最多累积 capacity 个"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def is_idle(self, now: float) -> bool:
+        """没有等待者且令牌已补满，此时该令牌桶与新建的没有区别"""
+        return not self._lock.locked() and self.updated_at + (self.capacity - self.tokens) / self.rate <= now
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, tokens: float = 1):
+        """获取令牌，不足时等待；等待者按先来后到依次获得令牌"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+class KeyedRateLimiter:
+    """为每个键（如抖音账号）维护独立的令牌桶
+
+    令牌已补满且没有等待者的令牌桶会被移除，下次使用时重新创建，
+    每隔一个补满周期检查一次，桶的数量只与近期活跃的键有关。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._next_prune = time.monotonic()
+
+    def _prune(self):
+        now = time.monotonic()
+        if now < self._next_prune or self.rate <= 0:
+            return
+        for key in [
+            key for key, bucket in self._buckets.items()
+            if bucket.is_idle(now)
+        ]:
+            del self._buckets[key]
+        self._next_prune = now + self.capacity / self.rate
+
+    async def acquire(self, key: Hashable, tokens: float = 1):
+        self._prune()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+        await bucket.acquire(tokens)
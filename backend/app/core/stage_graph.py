@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.core.media import file_identity
+
+logger = logging.getLogger(__name__)
+
+class StageFailed(Exception):
+    """某个阶段执行失败，消息带上阶段的说明，便于直接展示给用户"""
+
+    def __init__(self, stage: "Stage", cause: BaseException):
+        super().__init__(f"{stage.error_label or stage.name}: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]  # 参数为依赖阶段的结果，按阶段名索引
+    depends_on: Tuple[str, ...] = ()
+    weight: float = 1.0  # 在总进度中所占的比例
+    error_label: Optional[str] = None
+    # 返回决定该阶段输出的输入参数（可序列化为 JSON），设置后该阶段的结果可以作为检查点恢复
+    fingerprint: Optional[Callable[[], Any]] = None
+    artifact: Optional[str] = None  # 阶段输出的文件，恢复时要求文件未被修改
+
+def _artifact_identity(path: Optional[str]) -> Optional[str]:
+    try:
+        return file_identity(path) if path else None
+    except FileNotFoundError:
+        return None
+
+class StageGraph:
+    """按依赖关系执行的阶段图
+
+    每个阶段在其依赖全部完成后立即开始，没有依赖关系的分支并发执行；
+    任意阶段失败时取消其余阶段并抛出 StageFailed。
+
+    传入 checkpoints 时，设置了 fingerprint 的阶段完成后把输入指纹、结果和输出文件的标识
+    记录在其中；再次执行时，依赖全部从检查点恢复、指纹相同且输出文件未变化的阶段直接返回记录的结果。
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("duplicate stage names")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order, visiting, done = [], set(), set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"stage graph has a cycle at {name}")
+            if name not in self.stages:
+                raise ValueError(f"unknown stage {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def _fingerprint(self, stage: Stage) -> str:
+        material = json.dumps(stage.fingerprint(), sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def run(self, on_stage_done: Optional[Callable[[str, float, Dict[str, dict]], None]] = None,
+                  checkpoints: Optional[Dict[str, dict]] = None) -> Tuple[Dict[str, Any], Dict[str, dict]]:
+        """执行所有阶段，返回 (各阶段结果, 各阶段耗时)
+
+        每个阶段完成时调用 on_stage_done(阶段名, 已完成的进度比例 0~1, 各阶段耗时)，
+        此时 checkpoints 已更新，调用方可在回调中保存。
+        """
+        total_weight = sum(stage.weight for stage in self.stages.values()) or 1
+        started = time.monotonic()
+        timings: Dict[str, dict] = {}
+        completed_weight = 0.0
+        tasks: Dict[str, asyncio.Task] = {}
+        restored: Set[str] = set()
+
+        def restore(stage: Stage, fingerprint: Optional[str]):
+            record = (checkpoints or {}).get(stage.name)
+            if (record is None or fingerprint is None or record.get("fingerprint") != fingerprint
+                    or not all(name in restored for name in stage.depends_on)):
+                return False, None
+            if stage.artifact and record.get("identity") != _artifact_identity(stage.artifact):
+                return False, None
+            return True, record.get("result")
+
+        async def run_stage(stage: Stage):
+            nonlocal completed_weight
+            inputs = {name: await tasks[name] for name in stage.depends_on}
+            stage_started = time.monotonic()
+            try:
+                fingerprint = self._fingerprint(stage) if checkpoints is not None and stage.fingerprint else None
+                hit, result = await asyncio.to_thread(restore, stage, fingerprint)
+                if hit:
+                    restored.add(stage.name)
+                else:
+                    result = await stage.run(inputs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                raise StageFailed(stage, e) from e
+            finished = time.monotonic()
+            timings[stage.name] = {
+                "started_at": round(stage_started - started, 3),
+                "seconds": round(finished - stage_started, 3),
+            }
+            if hit:
+                timings[stage.name]["restored"] = True
+            elif fingerprint is not None:
+                checkpoints[stage.name] = {
+                    "fingerprint": fingerprint,
+                    "result": result,
+                    "artifact": stage.artifact,
+                    "identity": await asyncio.to_thread(_artifact_identity, stage.artifact),
+                }
+            completed_weight += stage.weight
+            if on_stage_done is not None:
+                on_stage_done(stage.name, completed_weight / total_weight, timings)
+            return result
+
+        # 先为所有阶段创建任务，阶段内部再等待各自的依赖
+        for name in self.order:
+            tasks[name] = asyncio.create_task(run_stage(self.stages[name]), name=f"stage:{name}")
+        try:
+            done, pending = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+            failed = next((task for task in done if not task.cancelled() and task.exception()), None)
+            if failed is not None:
+                raise failed.exception()
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        total = round(time.monotonic() - started, 3)
+        logger.info(f"Stage graph finished in {total}s: {timings}")
+        return {name: task.result() for name, task in tasks.items()}, timings
@@ -0,0 +1,447 @@
+import asyncio
+import heapq
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import select, func
+
+from app.core.blob_store import blob_store
+from app.core.config import settings
+from app.core.task_queue import TaskStatus
+from app.core.task_store import loads
+from app.core.upload_sessions import upload_sessions
+from app.db.database import sync_engine
+from app.models.video_blob import VideoBlob, UserVideo
+
+logger = logging.getLogger(__name__)
+
+# 写入过程中的临时文件：file.<uuid>.ext、file.<uuid>.link、dir.<uuid>.tmp、file.json.tmp
+TEMP_NAME = re.compile(r"\.[0-9a-f]{32}(\.|$)|\.tmp$")
+# 视频处理的中间文件，与原视频放在同一目录
+INTERMEDIATE_SUFFIXES = ("_no_subtitle.mp4", "_new_audio.wav")
+# 容量超限时淘汰到上限的这个比例，避免每轮只删一点
+LRU_LOW_WATERMARK = 0.9
+ACTIVE_TASK_STATUSES = [TaskStatus.PENDING, TaskStatus.SCHEDULED, TaskStatus.RUNNING, TaskStatus.RETRYING]
+
+class StorageQuotaExceeded(Exception):
+    def __init__(self, used: int, quota: int):
+        super().__init__(f"storage quota exceeded: {used} of {quota} bytes used")
+        self.used = used
+        self.quota = quota
+
+@dataclass
+class StorageEntry:
+    name: str
+    path: str
+    inode: int
+    dev: int
+    is_dir: bool
+    size: int
+    mtime: float
+    atime: float  # 子目录取其中文件最近的访问时间
+
+def _measure_tree(path: str):
+    size, atime = 0, 0.0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                st = os.stat(os.path.join(dirpath, filename))
+            except FileNotFoundError:
+                continue
+            size += st.st_size
+            atime = max(atime, st.st_atime)
+    return size, atime
+
+def _measure(path: str, name: str) -> StorageEntry:
+    st = os.stat(path, follow_symlinks=False)
+    is_dir = os.path.isdir(path)
+    size, atime = _measure_tree(path) if is_dir else (st.st_size, st.st_atime)
+    return StorageEntry(name, path, st.st_ino, st.st_dev, is_dir, size, st.st_mtime, atime or st.st_mtime)
+
+class DirectoryIndex:
+    """目录直接子项的增量索引
+
+    目录的修改时间不变时不重新列目录；重新列目录时只对新出现或 inode 变化的子项调用 stat。
+    本项目的文件都是先写临时文件再重命名生成的，内容变化一定伴随 inode 变化；
+    原地修改的文件由定期的完整扫描校正。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.entries: Dict[str, StorageEntry] = {}
+        self._mtime_ns: Optional[int] = None
+
+    def refresh(self, full: bool = False) -> bool:
+        """返回目录内容是否可能发生了变化"""
+        try:
+            # 先取目录修改时间再列目录，列目录期间发生的变化会在下一轮被发现
+            mtime_ns = os.stat(self.root).st_mtime_ns
+        except FileNotFoundError:
+            changed = bool(self.entries)
+            self.entries, self._mtime_ns = {}, None
+            return changed
+        if not full and mtime_ns == self._mtime_ns:
+            return False
+
+        entries = {}
+        with os.scandir(self.root) as it:
+            for item in it:
+                cached = self.entries.get(item.name)
+                if not full and cached is not None and cached.inode == item.inode():
+                    entries[item.name] = cached
+                    continue
+                try:
+                    entries[item.name] = _measure(item.path, item.name)
+                except FileNotFoundError:
+                    continue
+        self.entries, self._mtime_ns = entries, mtime_ns
+        return True
+
+    def discard(self, name: str):
+        self.entries.pop(name, None)
+
+    @property
+    def size(self) -> int:
+        return sum(entry.size for entry in self.entries.values())
+
+def _remove_entry(entry: StorageEntry):
+    if entry.is_dir:
+        # 先整体重命名，读取方不会看到删了一半的目录
+        tmp_path = f"{entry.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.rename(entry.path, tmp_path)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    else:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+def _group_key(name: str) -> str:
+    # 同一缓存项的文件共用前缀：<标识>.jpg / <标识>_sprite.{jpg,vtt,json} / <哈希>_<参数>.{mp4,json}
+    return name.split(".")[0].removesuffix("_sprite")
+
+class StorageManager:
+    """上传目录和各类缓存的空间管理
+
+    - 预览图、HLS、AI代理文件、声音缓存等可再生成的缓存按目录配置 TTL 和容量上限，
+      超过容量时按最近访问时间淘汰；
+    - 中间文件、写入中断留下的临时文件、失去内容的 HLS、没有引用的内容文件按孤儿清理，
+      判断时参考任务存储中未结束的任务；
+    - 用户文件只统计和限额，不会被自动删除。
+    扫描是增量的，目录未变化时只需要 stat 目录本身。
+    """
+
+    def __init__(self, task_store=None):
+        self.task_store = task_store
+        self.policies = settings.STORAGE_POLICIES
+        self.cache_dirs = {
+            "previews": settings.PREVIEW_DIR,
+            "hls": settings.HLS_DIR,
+            "proxies": settings.AI_PROXY_DIR,
+            "voice": settings.VOICE_CACHE_DIR,
+        }
+        self.user_dirs = {
+            "videos": settings.UPLOAD_DIR,
+            "processed_videos": settings.PROCESSED_DIR,
+        }
+        self.indexes: Dict[str, DirectoryIndex] = {
+            name: DirectoryIndex(path) for name, path in {**self.cache_dirs, **self.user_dirs}.items()
+        }
+        self.indexes["blob_incoming"] = DirectoryIndex(os.path.dirname(blob_store.incoming_path()))
+        self.blob_root = DirectoryIndex(blob_store.root)
+        self.blob_shards: Dict[str, DirectoryIndex] = {}
+        self._tracked_paths: Set[str] = set()
+        self._orphans: List[dict] = []
+        self._missing_blobs = 0
+        self._last_full_scan = 0.0
+        self.last_pass: Optional[dict] = None
+        self._lock = asyncio.Lock()
+
+    # 增量扫描
+
+    def _refresh_blobs(self, full: bool) -> bool:
+        changed = self.blob_root.refresh(full)
+        shards = {
+            name for name, entry in self.blob_root.entries.items()
+            if entry.is_dir and len(name) == 2
+        }
+        for name in shards - self.blob_shards.keys():
+            self.blob_shards[name] = DirectoryIndex(os.path.join(blob_store.root, name))
+        for name in self.blob_shards.keys() - shards:
+            del self.blob_shards[name]
+            changed = True
+        for index in self.blob_shards.values():
+            changed = index.refresh(full) or changed
+        return changed
+
+    def _blob_entries(self) -> Dict[str, StorageEntry]:
+        return {name: entry for index in self.blob_shards.values() for name, entry in index.entries.items()}
+
+    def _active_task_paths(self) -> Set[str]:
+        """未结束的视频处理任务使用的原视频和输出路径"""
+        if self.task_store is None:
+            return set()
+        paths = set()
+        for record in self.task_store.load_by_status(ACTIVE_TASK_STATUSES):
+            data = loads(record.get("data")) or {}
+            paths.update(data[key] for key in ("original_path", "processed_path") if data.get(key))
+        return paths
+
+    def _load_blob_refs(self) -> Set[str]:
+        blobs = VideoBlob.__table__
+        with sync_engine.connect() as conn:
+            return set(conn.execute(select(blobs.c.sha256)).scalars())
+
+    def _load_tracked_paths(self) -> Set[str]:
+        videos = UserVideo.__table__
+        with sync_engine.connect() as conn:
+            return set(conn.execute(select(videos.c.path)).scalars())
+
+    # 清理
+
+    def _delete(self, index: DirectoryIndex, entries: List[StorageEntry], reason: str, stats: dict):
+        # 缓存项的索引文件（.json）最后写入、最先删除，存在即表示其余文件完整
+        for entry in sorted(entries, key=lambda e: not e.name.endswith(".json")):
+            _remove_entry(entry)
+            index.discard(entry.name)
+            stats["deleted"][reason] = stats["deleted"].get(reason, 0) + 1
+            stats["freed_bytes"] += entry.size
+
+    def _expire_temp(self, index: DirectoryIndex, now: float, stats: dict, all_temp: bool = False):
+        deadline = now - settings.STORAGE_ORPHAN_GRACE
+        stale = [
+            entry for entry in index.entries.values()
+            if (all_temp or TEMP_NAME.search(entry.name)) and entry.mtime < deadline
+        ]
+        self._delete(index, stale, "temp", stats)
+
+    def _fresh_atime(self, entries: List[StorageEntry]) -> float:
+        atime = 0.0
+        for entry in entries:
+            try:
+                entry.atime = _measure_tree(entry.path)[1] if entry.is_dir else os.stat(entry.path).st_atime
+            except FileNotFoundError:
+                continue
+            atime = max(atime, entry.atime)
+        return atime
+
+    def _evict_cache(self, name: str, now: float, blobs: Optional[Set[str]], stats: dict):
+        index = self.indexes[name]
+        policy = self.policies.get(name) or {}
+        self._expire_temp(index, now, stats)
+
+        groups: Dict[str, List[StorageEntry]] = {}
+        for entry in index.entries.values():
+            if not TEMP_NAME.search(entry.name):
+                groups.setdefault(_group_key(entry.name), []).append(entry)
+
+        if name == "hls" and blobs is not None:
+            # 内容已经删除的视频，HLS 也不再需要
+            deadline = now - settings.STORAGE_ORPHAN_GRACE
+            for key in [key for key, entries in groups.items()
+                        if key not in blobs and all(e.mtime < deadline for e in entries)]:
+                self._delete(index, groups.pop(key), "orphan", stats)
+
+        ttl = policy.get("ttl")
+        if ttl:
+            deadline = now - ttl
+            for key in [key for key, entries in groups.items() if max(e.atime for e in entries) < deadline]:
+                # 访问时间以删除前重新读取的为准
+                if self._fresh_atime(groups[key]) < deadline:
+                    self._delete(index, groups.pop(key), "ttl", stats)
+
+        max_bytes = policy.get("max_bytes")
+        total = sum(entry.size for entries in groups.values() for entry in entries)
+        if max_bytes and total > max_bytes:
+            target = max_bytes * LRU_LOW_WATERMARK
+            heap = [(max(e.atime for e in entries), key) for key, entries in groups.items()]
+            heapq.heapify(heap)
+            while heap and total > target:
+                atime, key = heapq.heappop(heap)
+                fresh = self._fresh_atime(groups[key])
+                if fresh > atime:
+                    # 扫描之后被访问过，按新的访问时间重新排队
+                    heapq.heappush(heap, (fresh, key))
+                    continue
+                total -= sum(entry.size for entry in groups[key])
+                self._delete(index, groups.pop(key), "lru", stats)
+
+    def _collect_user_orphans(self, now: float, active: Set[str], stats: dict):
+        deadline = now - settings.STORAGE_ORPHAN_GRACE
+        active_stems = {os.path.splitext(path)[0] for path in active}
+        orphans = []
+        for name in self.user_dirs:
+            index = self.indexes[name]
+            self._expire_temp(index, now, stats)
+            for entry in list(index.entries.values()):
+                if entry.path in self._tracked_paths or entry.mtime >= deadline or entry.path in active:
+                    continue
+                if TEMP_NAME.search(entry.name):
+                    continue
+                suffix = next((s for s in INTERMEDIATE_SUFFIXES if entry.name.endswith(s)), None)
+                if suffix is not None:
+                    # 视频处理失败时留下的中间文件
+                    if entry.path[:-len(suffix)] not in active_stems:
+                        self._delete(index, [entry], "intermediate", stats)
+                elif settings.STORAGE_DELETE_UNTRACKED:
+                    self._delete(index, [entry], "untracked", stats)
+                else:
+                    orphans.append({"path": entry.path, "size": entry.size, "mtime": entry.mtime})
+        self._orphans = orphans
+
+    def _collect_blob_orphans(self, now: float, refs: Set[str], stats: dict):
+        deadline = now - settings.STORAGE_ORPHAN_GRACE
+        for index in self.blob_shards.values():
+            for entry in list(index.entries.values()):
+                if entry.name not in refs and entry.mtime < deadline:
+                    self._delete(index, [entry], "temp" if TEMP_NAME.search(entry.name) else "orphan_blob", stats)
+        self._missing_blobs = len(refs - self._blob_entries().keys())
+
+    def _run_pass(self, full: bool) -> dict:
+        started = time.time()
+        stats = {"deleted": {}, "freed_bytes": 0}
+        changed = {name: index.refresh(full) for name, index in self.indexes.items()}
+        blobs_changed = self._refresh_blobs(full)
+
+        refs = self._load_blob_refs()
+        if full or changed["videos"] or changed["processed_videos"] or not self._tracked_paths:
+            self._tracked_paths = self._load_tracked_paths()
+        active = self._active_task_paths()
+
+        blob_names = set(self._blob_entries())
+        for name in self.cache_dirs:
+            self._evict_cache(name, started, blob_names, stats)
+        self._collect_user_orphans(started, active, stats)
+        if full or blobs_changed:
+            self._collect_blob_orphans(started, refs, stats)
+        self._expire_temp(self.indexes["blob_incoming"], started, stats, all_temp=True)
+
+        return {
+            **stats,
+            "full": full,
+            "started_at": datetime.fromtimestamp(started).isoformat(),
+            "seconds": round(time.time() - started, 3),
+        }
+
+    async def run_pass(self, full: bool = False) -> dict:
+        """执行一轮扫描和清理，返回本轮统计"""
+        async with self._lock:
+            stats = await asyncio.to_thread(self._run_pass, full)
+            stats["upload_sessions_expired"] = await upload_sessions.cleanup_expired()
+            if full:
+                self._last_full_scan = time.time()
+            self.last_pass = stats
+        if stats["freed_bytes"]:
+            logger.info(f"Storage pass freed {stats['freed_bytes']} bytes: {stats['deleted']}")
+        return stats
+
+    async def run(self):
+        """后台定期清理，每隔 STORAGE_FULL_SCAN_INTERVAL 做一次完整扫描"""
+        while True:
+            try:
+                full = time.time() - self._last_full_scan >= settings.STORAGE_FULL_SCAN_INTERVAL
+                await self.run_pass(full)
+            except Exception as e:
+                logger.error(f"Storage pass failed: {e}")
+            await asyncio.sleep(settings.STORAGE_SCAN_INTERVAL)
+
+    # 配额和统计
+
+    def quota_for(self, user_id: int) -> int:
+        return settings.STORAGE_USER_QUOTAS.get(str(user_id), settings.STORAGE_USER_QUOTA)
+
+    def _usage_query(self):
+        videos, blobs = UserVideo.__table__, VideoBlob.__table__
+        return (
+            select(
+                videos.c.user_id,
+                func.count(videos.c.id).label("videos"),
+                func.coalesce(func.sum(blobs.c.size), 0).label("bytes")
+            )
+            .join(blobs, blobs.c.sha256 == videos.c.sha256)
+            .group_by(videos.c.user_id)
+        )
+
+    def _user_usage(self, user_id: int) -> int:
+        with sync_engine.connect() as conn:
+            row = conn.execute(self._usage_query().where(UserVideo.__table__.c.user_id == user_id)).first()
+        return row.bytes if row else 0
+
+    async def user_usage(self, user_id: int) -> int:
+        """用户文件占用的字节数，共享内容的文件按各自的大小计入每个用户"""
+        return await asyncio.to_thread(self._user_usage, user_id)
+
+    async def check_quota(self, user_id: int, incoming: int):
+        """新增 incoming 字节后超过配额时抛出 StorageQuotaExceeded，配额为 0 表示不限制"""
+        quota = self.quota_for(user_id)
+        if not quota:
+            return
+        used = await self.user_usage(user_id)
+        if used + incoming > quota:
+            raise StorageQuotaExceeded(used, quota)
+
+    def _top_users(self, limit: int) -> List[dict]:
+        query = self._usage_query().order_by(func.sum(VideoBlob.__table__.c.size).desc()).limit(limit)
+        with sync_engine.connect() as conn:
+            rows = conn.execute(query).all()
+        return [
+            {"user_id": row.user_id, "videos": row.videos, "bytes": row.bytes,
+             "quota": self.quota_for(row.user_id) if row.user_id is not None else None}
+            for row in rows
+        ]
+
+    async def report(self, top_users: int = 20) -> dict:
+        """各目录占用、用户用量和孤儿文件，硬链接共享的内容在总量中只计一次"""
+        if self.last_pass is None:
+            await self.run_pass()
+        async with self._lock:
+            directories = {
+                name: {
+                    "path": index.root,
+                    "entries": len(index.entries),
+                    "bytes": index.size,
+                    "policy": self.policies.get(name),
+                }
+                for name, index in self.indexes.items()
+            }
+            blob_entries = self._blob_entries()
+            directories["blobs"] = {
+                "path": blob_store.root,
+                "entries": len(blob_entries),
+                "bytes": sum(entry.size for entry in blob_entries.values()),
+                "policy": None,
+            }
+            unique = {
+                (entry.dev, entry.inode): entry.size
+                for entries in [*(index.entries.values() for index in self.indexes.values()),
+                                blob_entries.values()]
+                for entry in entries
+            }
+            orphans = list(self._orphans)
+            missing_blobs = self._missing_blobs
+        return {
+            "directories": directories,
+            "total_bytes": sum(unique.values()),
+            "users": await asyncio.to_thread(self._top_users, top_users),
+            "default_quota": settings.STORAGE_USER_QUOTA,
+            "orphans": {
+                "untracked_files": orphans[:100],
+                "untracked_count": len(orphans),
+                "untracked_bytes": sum(orphan["size"] for orphan in orphans),
+                "missing_blobs": missing_blobs,
+            },
+            "last_pass": self.last_pass,
+        }
+
+# 全局存储管理器，任务存储在 API 进程启动时设置
+storage_manager = StorageManager()
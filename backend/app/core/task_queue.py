@@ -1,14 +1,22 @@
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Set, Tuple
 import asyncio
+from collections import defaultdict
 from datetime import datetime
 import heapq
+import itertools
+import random
+import time
 from dataclasses import dataclass, field
 import logging
 from sqlalchemy.orm import Session
-from app.db.database import SessionLocal
-from app.models.user import User
 from app.core.config import settings
+from app.core.task_store import TaskStore, dumps, loads
+from app.core.history_writer import HistoryWriter
+from app.core.rate_limit import KeyedRateLimiter
+from app.core.fair_scheduler import FairScheduler
+from datetime import timedelta
 import os
+import socket
 import subprocess
 import shutil
 
@@ -23,9 +31,19 @@ class TaskStatus:
     FAILED = "failed"
     RETRYING = "retrying"
 
+class ExecutionRole:
+    EMBEDDED = "embedded"  # API进程内直接执行任务
+    API = "api"  # API进程只负责入队和查询，任务由独立工作进程执行
+    WORKER = "worker"  # 独立工作进程，从任务存储领取任务执行
+
+class TaskPriority:
+    INTERACTIVE = "interactive"  # 用户等待结果的少量任务
+    BULK = "bulk"  # 批量任务
+
 @dataclass(order=True)
 class ScheduledTask:
-    schedule_time: datetime
+    deadline: float  # 到期时间戳
+    seq: int  # 相同到期时间时按加入顺序
     task: 'Task' = field(compare=False)
 
 class Task:
@@ -33,7 +51,9 @@ class Task:
         self.task_id = task_id
         self.task_type = task_type
         self.data = data
-        self.status = TaskStatus.PENDING
+        # 状态变化回调，由任务队列用来维护按状态的索引
+        self.on_status_change: Optional[Callable[['Task', str, str], None]] = None
+        self._status = TaskStatus.PENDING
         self.progress = 0
         self.result = None
         self.error = None
@@ -42,7 +62,72 @@ class Task:
         self.retry_count = 0
         self.max_retries = settings.MAX_RETRY_COUNT
         self.last_retry = None
+        self.next_attempt_at: Optional[datetime] = None  # 下次重试时间
         self.schedule_time = data.get('schedule_time')
+        self.priority = data.get('priority', TaskPriority.BULK)
+        self.worker_id: Optional[int] = None  # 正在执行该任务的工作协程编号
+        self.lease_owner: Optional[str] = None  # 持有该任务租约的工作进程
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @status.setter
+    def status(self, value: str):
+        old = self._status
+        self._status = value
+        if old != value and self.on_status_change is not None:
+            self.on_status_change(self, old, value)
+
+    @property
+    def user_id(self) -> Optional[int]:
+        return self.data.get("user_id")
+
+    def to_record(self) -> dict:
+        """转换为任务存储的行记录"""
+        return {
+            "task_id": self.task_id,
+            "task_type": self.task_type,
+            "user_id": self.user_id,
+            "status": self.status,
+            "progress": self.progress,
+            "data": dumps(self.data),
+            "result": dumps(self.result),
+            "error": self.error,
+            "retry_count": self.retry_count,
+            "max_retries": self.max_retries,
+            "created_at": self.created_at.timestamp(),
+            "updated_at": self.updated_at.timestamp(),
+            "schedule_at": self.schedule_time.timestamp() if self.schedule_time else None,
+            "last_retry": self.last_retry.timestamp() if self.last_retry else None,
+            "next_attempt_at": self.next_attempt_at.timestamp() if self.next_attempt_at else None,
+            "priority": self.priority,
+            "lease_owner": self.lease_owner,
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> 'Task':
+        """从任务存储的行记录恢复任务"""
+        data = loads(record["data"]) or {}
+        schedule_time = None
+        if record["schedule_at"] is not None:
+            schedule_time = datetime.fromtimestamp(record["schedule_at"])
+            data["schedule_time"] = schedule_time
+        task = cls(record["task_id"], record["task_type"], data)
+        task.status = record["status"]
+        task.progress = record["progress"]
+        task.result = loads(record["result"])
+        task.error = record["error"]
+        task.retry_count = record["retry_count"]
+        task.max_retries = record["max_retries"]
+        task.created_at = datetime.fromtimestamp(record["created_at"])
+        task.updated_at = datetime.fromtimestamp(record["updated_at"])
+        if record["last_retry"] is not None:
+            task.last_retry = datetime.fromtimestamp(record["last_retry"])
+        if record.get("next_attempt_at") is not None:
+            task.next_attempt_at = datetime.fromtimestamp(record["next_attempt_at"])
+        task.lease_owner = record.get("lease_owner")
+        return task
 
 class TaskQueue:
     _instance = None
@@ -50,36 +135,250 @@ class TaskQueue:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(TaskQueue, cls).__new__(cls)
+            cls._instance.role = (
+                ExecutionRole.API if settings.TASK_EXECUTION_MODE == "external"
+                else ExecutionRole.EMBEDDED
+            )
+            cls._instance.worker_name: Optional[str] = None
+            # 工作进程不领取的任务类型
+            cls._instance.excluded_types: Set[str] = set()
+            # 内存中的任务缓存，持久化数据以任务存储为准
             cls._instance.tasks: Dict[str, Task] = {}
-            cls._instance.queue = asyncio.Queue()
+            # 任务缓存的二级索引：按用户、状态、类型
+            cls._instance.tasks_by_user: Dict[Optional[int], Set[str]] = defaultdict(set)
+            cls._instance.tasks_by_status: Dict[str, Set[str]] = defaultdict(set)
+            cls._instance.tasks_by_type: Dict[str, Set[str]] = defaultdict(set)
+            cls._instance.store = TaskStore(settings.TASK_DB_FILE)
+            cls._instance.history = HistoryWriter(settings.HISTORY_FLUSH_INTERVAL)
+            cls._instance.worker_count = max(1, settings.TASK_WORKER_COUNT)
+            cls._instance.type_limits: Dict[str, int] = dict(settings.TASK_TYPE_CONCURRENCY)
+            # 就绪队列：按优先级和用户公平调度
+            cls._instance.ready = FairScheduler(
+                priorities=settings.TASK_PRIORITY_CLASSES,
+                type_limits=cls._instance.type_limits,
+                default_limit=cls._instance.worker_count,
+                user_max_inflight=settings.TASK_USER_MAX_INFLIGHT,
+                user_weights=settings.TASK_USER_WEIGHTS
+            )
+            cls._instance.ready_cond = asyncio.Condition()
+            cls._instance.workers: List[asyncio.Task] = []
+            # 工作进程中正在执行的任务，租约丢失时据此取消
+            cls._instance.running_tasks: Dict[str, asyncio.Task] = {}
+            cls._instance.lost_leases: Set[str] = set()
+            cls._instance.background: List[asyncio.Task] = []
+            cls._instance.claim_wakeup = asyncio.Event()
+            # 定时任务和待重试任务共用一个按到期时间排序的堆
             cls._instance.scheduled_tasks: List[ScheduledTask] = []
+            cls._instance.schedule_seq = itertools.count()
+            cls._instance.schedule_wakeup = asyncio.Event()
             cls._instance.retry_delays = settings.RETRY_DELAY
+            cls._instance.retry_jitter = settings.RETRY_JITTER
+            # 每个抖音账号的发布频率限制
+            cls._instance.account_limiter = KeyedRateLimiter(
+                settings.DOUYIN_ACCOUNT_RATE_PER_MINUTE / 60,
+                settings.DOUYIN_ACCOUNT_BURST
+            )
             cls._instance.history_cleanup_interval = 7 * 24 * 60 * 60  # 7天
             cls._instance.running = False
         return cls._instance
 
-    async def add_task(self, task: Task) -> str:
+    def _cache_task(self, task: Task):
+        """放入任务缓存并建立索引"""
         self.tasks[task.task_id] = task
+        self.tasks_by_user[task.user_id].add(task.task_id)
+        self.tasks_by_status[task.status].add(task.task_id)
+        self.tasks_by_type[task.task_type].add(task.task_id)
+        task.on_status_change = self._on_status_change
+
+    def _evict_task(self, task_id: str):
+        """从任务缓存和索引中移除"""
+        task = self.tasks.pop(task_id, None)
+        if task is None:
+            return
+        task.on_status_change = None
+        for index, key in (
+            (self.tasks_by_user, task.user_id),
+            (self.tasks_by_status, task.status),
+            (self.tasks_by_type, task.task_type),
+        ):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(task_id)
+                if not ids:
+                    del index[key]
+
+    def _on_status_change(self, task: Task, old: str, new: str):
+        ids = self.tasks_by_status.get(old)
+        if ids is not None:
+            ids.discard(task.task_id)
+            if not ids:
+                del self.tasks_by_status[old]
+        self.tasks_by_status[new].add(task.task_id)
+
+    async def add_task(self, task: Task) -> str:
+        if self.role == ExecutionRole.API:
+            # 只写入任务存储，由工作进程领取执行
+            if task.schedule_time and task.schedule_time.timestamp() > time.time():
+                task.status = TaskStatus.SCHEDULED
+            self.persist(task)
+            await self.store.flush()
+            return task.task_id
+        
+        self._cache_task(task)
+        await self._dispatch(task)
+        self.persist(task)
+        
+        if not self.running:
+            asyncio.create_task(self.process_tasks())
         
-        if task.schedule_time and task.schedule_time > datetime.now():
+        return task.task_id
+
+    async def _dispatch(self, task: Task):
+        if task.status == TaskStatus.RETRYING and task.next_attempt_at:
+            # 恢复的待重试任务按原定的重试时间继续等待
+            self.schedule_at(task, task.next_attempt_at.timestamp())
+        elif task.schedule_time and task.schedule_time.timestamp() > time.time():
             # 如果是定时任务且时间未到，加入定时队列
             task.status = TaskStatus.SCHEDULED
-            heapq.heappush(self.scheduled_tasks, ScheduledTask(task.schedule_time, task))
+            self.schedule_at(task, task.schedule_time.timestamp())
         else:
             # 否则直接加入普通队列
-            await self.queue.put(task)
+            task.status = TaskStatus.PENDING
+            await self.enqueue(task)
+
+    def persist(self, task: Task):
+        """标记任务需要写入任务存储，由后台批量写入"""
+        self.store.mark_dirty(task.to_record())
+
+    async def recover_tasks(self):
+        """启动时从任务存储恢复未完成的任务并重新入队"""
+        try:
+            records = await asyncio.to_thread(self.store.load_by_status, [
+                TaskStatus.PENDING, TaskStatus.SCHEDULED,
+                TaskStatus.RETRYING, TaskStatus.RUNNING
+            ])
+        except Exception as e:
+            logger.error(f"Error loading tasks from store: {e}")
+            return
         
-        if not self.running:
-            self.running = True
-            asyncio.create_task(self._process_queue())
+        for record in records:
+            if record["task_id"] in self.tasks:
+                continue
+            task = Task.from_record(record)
+            self._cache_task(task)
+            # 崩溃时正在执行的任务需要重新执行
+            await self._dispatch(task)
+            self.persist(task)
         
-        return task.task_id
-    
-    def get_task(self, task_id: str) -> Optional[Task]:
-        return self.tasks.get(task_id)
+        if records:
+            logger.info(f"Recovered {len(records)} unfinished tasks from store")
     
-    def get_all_tasks(self) -> List[Task]:
-        return list(self.tasks.values())
+    async def get_task(self, task_id: str) -> Optional[Task]:
+        if self.role == ExecutionRole.API:
+            # 任务状态由工作进程更新，直接读取任务存储
+            record = await asyncio.to_thread(self.store.get, task_id)
+            return Task.from_record(record) if record is not None else None
+        
+        task = self.tasks.get(task_id)
+        if task is None:
+            # 缓存未命中时从任务存储读取
+            record = await asyncio.to_thread(self.store.get, task_id)
+            task = self.tasks.get(task_id)
+            if task is None and record is not None:
+                task = Task.from_record(record)
+                self._cache_task(task)
+        return task
+
+    async def query_tasks(self, user_id: Optional[int] = None, status: Optional[str] = None,
+                          task_type: Optional[str] = None, limit: Optional[int] = None,
+                          offset: int = 0) -> Tuple[int, List[Task]]:
+        """按用户、状态、类型筛选任务，按创建时间倒序分页
+
+        缓存中只有未结束的任务（重启后只恢复这些），查询可能包含已结束的任务时从任务存储分页，
+        缓存中已有的任务使用缓存中的对象；写缓冲中尚未落盘的状态变化最多在一个刷新间隔后
+        反映到筛选和总数上，读取时不强制刷新。只查询未结束的状态时在缓存中
+        从最小的索引集合开始求交集，开销只与命中的任务数量有关。
+        返回 (总数, 当前页任务列表)。
+        """
+        if self.role == ExecutionRole.API:
+            total, records = await asyncio.to_thread(
+                self.store.query, user_id, status, task_type, limit, offset
+            )
+            return total, [Task.from_record(record) for record in records]
+        
+        if status is None or status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+            total, records = await asyncio.to_thread(
+                self.store.query, user_id, status, task_type, limit, offset
+            )
+            return total, [self.tasks.get(record["task_id"]) or Task.from_record(record) for record in records]
+        
+        candidates = []
+        if user_id is not None:
+            candidates.append(self.tasks_by_user.get(user_id, set()))
+        if status is not None:
+            candidates.append(self.tasks_by_status.get(status, set()))
+        if task_type is not None:
+            candidates.append(self.tasks_by_type.get(task_type, set()))
+        
+        if candidates:
+            candidates.sort(key=len)
+            task_ids = candidates[0].intersection(*candidates[1:])
+        else:
+            task_ids = self.tasks.keys()
+        
+        tasks = sorted(
+            (self.tasks[task_id] for task_id in task_ids),
+            key=lambda task: task.created_at,
+            reverse=True
+        )
+        end = offset + limit if limit is not None else None
+        return len(tasks), tasks[offset:end]
+
+    async def get_queue_stats(self) -> dict:
+        """获取队列深度和工作协程使用情况"""
+        if self.role == ExecutionRole.API:
+            return {"role": self.role, "status_counts": await asyncio.to_thread(self.store.status_counts)}
+        
+        stats = self.ready.stats()
+        running = stats["running"]
+        stats.update({
+            "role": self.role,
+            "workers": self.worker_count,
+            "busy_workers": sum(running.values()),
+            "type_limits": {
+                task_type: self.ready.type_limit(task_type)
+                for task_type in set(self.type_limits) | set(stats["queued"]) | set(running)
+            },
+            "user_max_inflight": self.ready.user_max_inflight,
+            "scheduled": len(self.scheduled_tasks),
+            # 已结束的任务不一定在缓存中，按任务存储统计，最多滞后一个刷新间隔
+            "status_counts": await asyncio.to_thread(self.store.status_counts),
+        })
+        return stats
+
+    async def enqueue(self, task: Task):
+        """将任务放入就绪队列并唤醒空闲的工作协程"""
+        async with self.ready_cond:
+            self.ready.push(task)
+            self.ready_cond.notify()
+
+    async def _acquire_task(self) -> Task:
+        async with self.ready_cond:
+            while True:
+                task = self.ready.pop()
+                if task is not None:
+                    return task
+                await self.ready_cond.wait()
+
+    async def _release_task(self, task: Task):
+        async with self.ready_cond:
+            self.ready.release(task)
+            # 释放了类型和用户额度，可能同时有多个任务变为可执行，唤醒所有等待中的工作协程重新挑选
+            self.ready_cond.notify_all()
+        if self.role == ExecutionRole.WORKER:
+            # 任务结果已交给任务存储，本地不再保留，并尽快领取新任务
+            self._evict_task(task.task_id)
+            self.claim_wakeup.set()
     
     def update_task_status(self, task_id: str, status: str, progress: int = None, 
                           result: dict = None, error: str = None):
@@ -93,6 +392,7 @@ class TaskQueue:
             if error is not None:
                 task.error = error
             task.updated_at = datetime.now()
+            self.persist(task)
     
     async def cleanup_old_tasks(self):
         """定期清理旧任务"""
@@ -100,12 +400,19 @@ class TaskQueue:
             try:
                 now = datetime.now()
                 old_tasks = [
-                    task_id for task_id, task in self.tasks.items()
-                    if (now - task.updated_at).days >= 7 and task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED]
+                    task_id
+                    for status in (TaskStatus.COMPLETED, TaskStatus.FAILED)
+                    for task_id in self.tasks_by_status.get(status, ())
+                    if (now - self.tasks[task_id].updated_at).days >= 7
                 ]
                 
                 for task_id in old_tasks:
-                    del self.tasks[task_id]
+                    self._evict_task(task_id)
+                
+                await self.store.delete_before(
+                    [TaskStatus.COMPLETED, TaskStatus.FAILED],
+                    now - timedelta(seconds=self.history_cleanup_interval)
+                )
                 
                 logger.info(f"Cleaned up {len(old_tasks)} old tasks")
             except Exception as e:
@@ -114,145 +421,318 @@ class TaskQueue:
             await asyncio.sleep(self.history_cleanup_interval)
 
     async def update_history(self, task: Task):
-        """更新用户的任务历史记录"""
-        try:
-            db = SessionLocal()
-            try:
-                user = db.query(User).filter(User.id == task.data.get("user_id")).first()
-                if user and user.douyin_history is not None:
-                    for record in user.douyin_history:
-                        if record.get("task_id") == task.task_id:
-                            record.update({
-                                "status": task.status,
-                                "success_count": task.result.get("success_count", 0) if task.result else 0,
-                                "failed_count": len(task.result.get("failed_accounts", [])) if task.result else 0,
-                                "updated_at": task.updated_at.isoformat(),
-                                "retries": task.retry_count
-                            })
-                            break
-                    db.commit()
-            finally:
-                db.close()
-        except Exception as e:
-            logger.error(f"Error updating history for task {task.task_id}: {e}")
+        """更新用户的任务历史记录
+
+        记录先进入延迟写入缓冲区，按周期批量落库；任务结束时立即写入最终状态。
+        """
+        self.history.mark(task)
+        if task.status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+            await self.history.flush()
+
+    def schedule_at(self, task: Task, deadline: float):
+        """把任务放入定时堆，到期后由调度器放入就绪队列"""
+        entry = ScheduledTask(deadline, next(self.schedule_seq), task)
+        heapq.heappush(self.scheduled_tasks, entry)
+        # 新任务比当前最早的到期时间还早时，提前唤醒调度器重新计算等待时间
+        if self.scheduled_tasks[0] is entry:
+            self.schedule_wakeup.set()
 
     async def process_scheduled_tasks(self):
-        """处理定时任务"""
+        """处理定时任务和待重试任务
+
+        调度器只睡眠到堆顶任务的到期时间，有更早的任务加入时被提前唤醒，
+        每次唤醒只处理已到期的任务。
+        """
         while True:
             try:
-                now = datetime.now()
-                
-                # 检查是否有定时任务需要执行
-                while self.scheduled_tasks and self.scheduled_tasks[0].schedule_time <= now:
+                now = time.time()
+                while self.scheduled_tasks and self.scheduled_tasks[0].deadline <= now:
                     scheduled_task = heapq.heappop(self.scheduled_tasks)
-                    logger.info(f"Processing scheduled task {scheduled_task.task.task_id}")
-                    await self.queue.put(scheduled_task.task)
-                    scheduled_task.task.status = TaskStatus.PENDING
-                
-                # 检查失败的任务是否需要重试
-                for task in self.tasks.values():
-                    if task.status == TaskStatus.FAILED and task.retry_count < task.max_retries:
-                        if task.last_retry:
-                            delay = self.retry_delays[min(task.retry_count, len(self.retry_delays) - 1)]
-                            if (now - task.last_retry).total_seconds() >= delay:
-                                await self.retry_task(task)
+                    task = scheduled_task.task
+                    logger.info(f"Processing scheduled task {task.task_id}")
+                    task.status = TaskStatus.PENDING
+                    task.next_attempt_at = None
+                    self.persist(task)
+                    await self.enqueue(task)
                 
+                timeout = None
+                if self.scheduled_tasks:
+                    timeout = max(0, self.scheduled_tasks[0].deadline - time.time())
+                self.schedule_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.schedule_wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
             except Exception as e:
                 logger.error(f"Error in process_scheduled_tasks: {e}")
-            
-            await asyncio.sleep(1)  # 每秒检查一次
+                await asyncio.sleep(1)
     
+    def retry_delay(self, retry_count: int) -> float:
+        """计算第 retry_count 次重试前的退避时间，加入随机抖动避免集中重试"""
+        delay = self.retry_delays[min(retry_count, len(self.retry_delays) - 1)]
+        if self.retry_jitter:
+            delay *= 1 + random.uniform(-self.retry_jitter, self.retry_jitter)
+        return max(0.0, delay)
+
     async def retry_task(self, task: Task):
-        """重试失败的任务"""
+        """重试失败的任务：记录下次重试时间后放入定时堆，立即释放工作协程"""
         if task.retry_count >= task.max_retries:
             task.status = TaskStatus.FAILED
             task.error = f"达到最大重试次数 ({task.max_retries})"
+            task.next_attempt_at = None
             await self.update_history(task)
             return
         
-        delay = self.retry_delays[min(task.retry_count, len(self.retry_delays) - 1)]
+        delay = self.retry_delay(task.retry_count)
         task.retry_count += 1
         task.status = TaskStatus.RETRYING
         task.last_retry = datetime.now()
+        task.next_attempt_at = task.last_retry + timedelta(seconds=delay)
         
-        logger.info(f"Retrying task {task.task_id} (attempt {task.retry_count}/{task.max_retries})")
+        logger.info(f"Retrying task {task.task_id} in {delay:.1f}s (attempt {task.retry_count}/{task.max_retries})")
+        self.persist(task)
         await self.update_history(task)
         
-        # 等待指定时间后重试
-        await asyncio.sleep(delay)
-        await self.queue.put(task)
+        if self.role == ExecutionRole.WORKER:
+            # 由任务存储在重试时间到期后重新分配给空闲的工作进程
+            return
+        self.schedule_at(task, task.next_attempt_at.timestamp())
     
     async def process_tasks(self):
-        """主任务处理循环"""
-        # 启动定时任务处理器和清理任务
-        asyncio.create_task(self.process_scheduled_tasks())
-        asyncio.create_task(self.cleanup_old_tasks())
+        """启动定时任务处理器、清理任务和工作协程池"""
+        if self.running:
+            return
+        self.running = True
+        
+        self._start_background(self.store.run_flusher(settings.TASK_STORE_FLUSH_INTERVAL))
+        self._start_background(self.cleanup_old_tasks())
+        if self.role == ExecutionRole.API:
+            logger.info("Task execution is delegated to external worker processes")
+            return
         
+        if self.role == ExecutionRole.WORKER:
+            self._start_background(self._claim_loop())
+            self._start_background(self._lease_loop())
+        else:
+            await self.recover_tasks()
+            self._start_background(self.process_scheduled_tasks())
+        self._start_background(self.history.run())
+        
+        self.workers = [
+            asyncio.create_task(self._worker(worker_id))
+            for worker_id in range(self.worker_count)
+        ]
+        logger.info(f"Started {self.worker_count} task workers ({self.role}), type limits: {self.type_limits}")
+        await asyncio.gather(*self.workers)
+
+    async def run_worker(self, excluded_types: Optional[Set[str]] = None):
+        """作为独立工作进程运行：通过租约从任务存储领取任务
+
+        excluded_types 中的任务类型不会被本进程领取。账号发布限流的令牌桶在进程内存中，
+        多个进程都领取发布任务时每个账号的发布频率会成倍增加，因此只应有一个进程领取 douyin_post。
+        """
+        self.role = ExecutionRole.WORKER
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        self.excluded_types = set(excluded_types or ())
+        await self.process_tasks()
+
+    def _start_background(self, coro):
+        self.background.append(asyncio.create_task(coro))
+
+    async def _claim_loop(self):
+        """按本进程空闲额度从任务存储领取任务，放入本地公平调度队列"""
         while True:
-            task = await self.queue.get()
+            claimed = 0
             try:
-                task.status = TaskStatus.RUNNING
-                await self.update_history(task)
-                
-                if task.task_type == "douyin_post":
-                    success = await self._process_douyin_post(task)
-                    if not success and task.retry_count < task.max_retries:
-                        await self.retry_task(task)
+                stats = self.ready.stats()
+                free_total = self.worker_count - stats["queued_total"] - sum(stats["running"].values())
+                for task_type in self.type_limits:
+                    if task_type in self.excluded_types:
                         continue
-                elif task.task_type == "video_processing":
-                    await self._process_video(task)
-                
+                    free = min(
+                        free_total - claimed,
+                        self.ready.type_limit(task_type)
+                        - stats["queued"].get(task_type, 0)
+                        - stats["running"].get(task_type, 0)
+                    )
+                    records = await asyncio.to_thread(
+                        self.store.claim, self.worker_name, task_type, free,
+                        settings.TASK_LEASE_SECONDS, self.ready.priorities
+                    )
+                    for record in records:
+                        task = Task.from_record(record)
+                        self._cache_task(task)
+                        await self.enqueue(task)
+                    claimed += len(records)
             except Exception as e:
-                logger.error(f"Error processing task {task.task_id}: {e}")
-                task.error = str(e)
-                if task.retry_count < task.max_retries:
-                    await self.retry_task(task)
-                else:
-                    task.status = TaskStatus.FAILED
-                    await self.update_history(task)
+                logger.error(f"Error claiming tasks: {e}")
+            
+            if claimed:
+                continue
+            # 没有可领取的任务时等待一段时间，本地任务完成后提前唤醒
+            self.claim_wakeup.clear()
+            try:
+                await asyncio.wait_for(self.claim_wakeup.wait(), settings.TASK_CLAIM_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _lease_loop(self):
+        """定期为本进程持有的任务续约，并回收其他进程过期的租约"""
+        while True:
+            await asyncio.sleep(settings.TASK_HEARTBEAT_INTERVAL)
+            try:
+                task_ids = list(self.tasks)
+                renewed = await asyncio.to_thread(
+                    self.store.renew_leases, self.worker_name, task_ids, settings.TASK_LEASE_SECONDS
+                )
+                lost = set(task_ids) - set(renewed)
+                if lost:
+                    logger.warning(f"Lost lease on {len(lost)} tasks, stopping them: {sorted(lost)}")
+                    self._abandon_tasks(lost)
+                reclaimed = await asyncio.to_thread(self.store.reclaim_expired)
+                if reclaimed:
+                    logger.warning(f"Reclaimed {reclaimed} tasks with expired leases")
+                    self.claim_wakeup.set()
+            except Exception as e:
+                logger.error(f"Error renewing task leases: {e}")
+
+    def _abandon_tasks(self, task_ids: Set[str]):
+        """租约已被其他工作进程接手的任务：停止本地执行并移出缓存，避免重复发布或处理"""
+        for task_id in task_ids:
+            if task_id not in self.tasks:
+                # 续约期间已经执行完毕
+                continue
+            self.lost_leases.add(task_id)
+            self._evict_task(task_id)
+            running = self.running_tasks.get(task_id)
+            if running is not None:
+                running.cancel()
+
+    async def shutdown(self):
+        """停止前把尚未写入的任务状态和历史记录刷入数据库"""
+        tasks = [*self.background, *self.workers, *self.running_tasks.values()]
+        for task in tasks:
+            task.cancel()
+        # 等待被取消的任务写完最后的状态，再刷新、释放租约和关闭存储
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.history.flush()
+        await self.store.flush()
+        if self.role == ExecutionRole.WORKER:
+            # 释放未完成任务的租约，让其他工作进程立即接手
+            released = await asyncio.to_thread(self.store.release_leases, self.worker_name)
+            if released:
+                logger.info(f"Released {released} unfinished tasks")
+        await asyncio.to_thread(self.store.close)
+
+    async def _worker(self, worker_id: int):
+        """工作协程：不断从就绪队列领取任务并执行"""
+        while True:
+            task = await self._acquire_task()
+            task.worker_id = worker_id
+            try:
+                if task.task_id not in self.lost_leases:
+                    # 单独的协程执行任务，租约丢失时只取消该任务，工作协程继续领取
+                    run = self.running_tasks[task.task_id] = asyncio.create_task(self._run_task(task))
+                    await run
+            except asyncio.CancelledError:
+                if task.task_id not in self.lost_leases:
+                    raise
+                logger.warning(f"Worker {worker_id} stopped task {task.task_id} after losing its lease")
+            except Exception as e:
+                logger.error(f"Worker {worker_id} failed on task {task.task_id}: {e}")
             finally:
+                task.worker_id = None
+                self.running_tasks.pop(task.task_id, None)
+                await self._release_task(task)
+                self.lost_leases.discard(task.task_id)
+
+    async def _run_task(self, task: Task):
+        """执行单个任务"""
+        try:
+            task.status = TaskStatus.RUNNING
+            self.persist(task)
+            await self.update_history(task)
+            
+            if task.task_type == "douyin_post":
+                success = await self._process_douyin_post(task)
+                if not success and task.retry_count < task.max_retries:
+                    await self.retry_task(task)
+                    return
+            elif task.task_type == "video_processing":
+                await self._process_video(task)
+                if task.status == TaskStatus.FAILED and task.retry_count < task.max_retries:
+                    await self.retry_task(task)
+                    return
+            
+        except Exception as e:
+            logger.error(f"Error processing task {task.task_id}: {e}")
+            task.error = str(e)
+            if task.retry_count < task.max_retries:
+                await self.retry_task(task)
+            else:
+                task.status = TaskStatus.FAILED
+                await self.update_history(task)
+        finally:
+            # 租约丢失的任务由其他工作进程接手，不再写入状态和历史记录
+            if task.task_id not in self.lost_leases:
                 task.updated_at = datetime.now()
+                self.persist(task)
                 await self.update_history(task)
-                self.queue.task_done()
     
+    async def _post_to_account(self, account: str, video_info: dict) -> bool:
+        """发布视频到单个抖音账号"""
+        # 这里实现实际的抖音发布逻辑
+        logger.info(f"Posting video to account {account}")
+        await asyncio.sleep(2)  # 模拟发布耗时
+        
+        # 模拟发布成功
+        return True  # 实际需要根据API返回判断
+
     async def _process_douyin_post(self, task: Task) -> bool:
-        """处理抖音视频发布任务"""
+        """处理抖音视频发布任务
+
+        多个账号并发发布，并发数由 DOUYIN_POST_CONCURRENCY 限制，
+        每个账号的发布频率由令牌桶限制。
+        """
         accounts = task.data.get("accounts", [])
         video_info = task.data.get("video_info", {})
-        user_id = task.data.get("user_id")
         total = len(accounts)
         success_count = 0
         failed_accounts = []
+        finished = 0
+        semaphore = asyncio.Semaphore(max(1, settings.DOUYIN_POST_CONCURRENCY))
+        
+        async def post(account: str):
+            nonlocal success_count, finished
+            try:
+                # 先等待账号的发布频率限制再占用并发额度，受限账号等待令牌时不占用其他账号的额度
+                await self.account_limiter.acquire(account)
+                async with semaphore:
+                    success = await self._post_to_account(account, video_info)
+            except Exception as e:
+                logger.error(f"Error posting to account {account}: {e}")
+                success = False
+            
+            # 所有协程运行在同一事件循环中，以下更新之间没有await，无需加锁
+            if success:
+                success_count += 1
+            else:
+                failed_accounts.append(account)
+            finished += 1
+            
+            self.update_task_status(
+                task.task_id,
+                TaskStatus.RUNNING,
+                int(finished / total * 100),
+                result={
+                    "success_count": success_count,
+                    "failed_accounts": list(failed_accounts)
+                }
+            )
+            await self.update_history(task)
         
         try:
-            for i, account in enumerate(accounts):
-                try:
-                    # 这里实现实际的抖音发布逻辑
-                    logger.info(f"Posting video to account {account}")
-                    await asyncio.sleep(2)  # 模拟发布耗时
-                    
-                    # 模拟发布成功
-                    success = True  # 实际需要根据API返回判断
-                    if success:
-                        success_count += 1
-                    else:
-                        failed_accounts.append(account)
-                    
-                    progress = int((i + 1) / total * 100)
-                    self.update_task_status(
-                        task.task_id,
-                        TaskStatus.RUNNING,
-                        progress,
-                        result={
-                            "success_count": success_count,
-                            "failed_accounts": failed_accounts
-                        }
-                    )
-                    await self.update_history(task)
-                    
-                except Exception as e:
-                    logger.error(f"Error posting to account {account}: {e}")
-                    failed_accounts.append(account)
+            await asyncio.gather(*(post(account) for account in accounts))
             
             # 更新任务状态和结果
             all_success = len(failed_accounts) == 0
@@ -270,8 +750,17 @@ class TaskQueue:
             logger.error(f"Error in _process_douyin_post for task {task.task_id}: {e}")
             raise
 
+    def _schedule_hls(self, processed_path: str, sha256: str, metadata: Optional[dict]) -> dict:
+        """在后台为处理结果生成审核预览用的 HLS，返回写入任务结果的播放地址"""
+        if not settings.HLS_ENABLED:
+            return {}
+        from app.core.hls import hls_packager
+        hls_packager.schedule(processed_path, sha256, metadata)
+        return {"hls_url": f"/api/v1/douyin/hls/{sha256}/master.m3u8"}
+
     async def _process_video(self, task: Task) -> None:
         """处理视频AI任务"""
+        temp_files = []
         try:
             self.update_task_status(task.task_id, TaskStatus.RUNNING, 10)
             
@@ -279,64 +768,143 @@ class TaskQueue:
             processed_path = task.data["processed_path"]
             text = task.data["text"]
             
-            # 1. 使用AI模型去除字幕并修复背景
+            # 相同的输入视频和文本已经处理过时，直接复用处理结果
+            from app.core.blob_store import blob_store, file_sha256
+            from app.core.video_index import video_index
+            input_sha256 = task.data.get("sha256") or await asyncio.to_thread(file_sha256, original_path)
+            cached_sha256 = await blob_store.find_processed(input_sha256, text)
+            if cached_sha256:
+                await blob_store.add_file(
+                    blob_store.blob_path(cached_sha256), processed_path, task.user_id,
+                    cached_sha256, move=False
+                )
+                metadata = await video_index.index(processed_path, task.user_id, cached_sha256)
+                self.update_task_status(
+                    task.task_id,
+                    TaskStatus.COMPLETED,
+                    100,
+                    result={
+                        "processed_path": processed_path,
+                        "cached": True,
+                        **self._schedule_hls(processed_path, cached_sha256, metadata)
+                    }
+                )
+                return
+            
+            # 上传前按服务商的分辨率和码率转码，减少上传的数据量
+            from app.core.proxy_transcode import proxy_transcoder
+            from app.core.ai_services import RunwayMLService, VoiceCloningService, LipSyncService
+            from app.core.stage_graph import Stage, StageGraph
+            proxy_stats = {}
+            transfers = []
             no_subtitle_path = f"{os.path.splitext(original_path)[0]}_no_subtitle.mp4"
-            try:
+            new_audio_path = f"{os.path.splitext(original_path)[0]}_new_audio.wav"
+            temp_files += [no_subtitle_path, new_audio_path]
+
+            async def inpaint(inputs):
                 # 使用RunwayML API进行视频修复（去除字幕并恢复背景）
-                from app.core.ai_services import RunwayMLService
+                proxy_stats["runway"] = await proxy_transcoder.prepare(original_path, input_sha256, "runway")
                 runway_service = RunwayMLService()
-                await runway_service.inpaint_video(
-                    input_path=original_path,
-                    output_path=no_subtitle_path,
-                    mask_type="text",  # 指定要移除文字
-                    restoration_quality="high"
-                )
-                self.update_task_status(task.task_id, TaskStatus.RUNNING, 40)
-            except Exception as e:
-                raise Exception(f"AI移除字幕失败: {str(e)}")
+                try:
+                    await runway_service.inpaint_video(
+                        input_path=proxy_stats["runway"]["path"],
+                        output_path=no_subtitle_path,
+                        mask_type="text",  # 指定要移除文字
+                        restoration_quality="high"
+                    )
+                finally:
+                    transfers.extend(runway_service.transfers)
+                return no_subtitle_path
 
-            # 2. 使用MockingBird或YourTTS进行声音克隆
-            try:
-                from app.core.ai_services import VoiceCloningService
-                voice_service = VoiceCloningService()
-                # 提取原始音频中的声音特征
-                voice_features = await voice_service.extract_voice_features(original_path)
+            voice_service = VoiceCloningService()
+
+            async def extract_voice(inputs):
+                # 提取原始音频中的声音特征，同一视频只提取一次
+                return await voice_service.extract_voice_features(original_path, input_sha256)
+
+            async def generate_speech(inputs):
                 # 使用提取的声音特征生成新的语音
-                new_audio_path = f"{os.path.splitext(original_path)[0]}_new_audio.wav"
-                await voice_service.generate_speech(
-                    text=text,
-                    voice_features=voice_features,
-                    output_path=new_audio_path
-                )
-                self.update_task_status(task.task_id, TaskStatus.RUNNING, 70)
-            except Exception as e:
-                raise Exception(f"AI语音克隆失败: {str(e)}")
+                try:
+                    await voice_service.generate_speech(
+                        text=text,
+                        voice_features=inputs["extract_voice"],
+                        output_path=new_audio_path
+                    )
+                finally:
+                    transfers.extend(voice_service.transfers)
+                return new_audio_path
 
-            # 3. 使用Wav2Lip或SadTalker进行唇形同步
-            try:
-                from app.core.ai_services import LipSyncService
+            async def lip_sync(inputs):
+                video_path = inputs["inpaint"]
+                video_sha256 = await asyncio.to_thread(file_sha256, video_path)
+                proxy_stats["lipsync"] = await proxy_transcoder.prepare(video_path, video_sha256, "lipsync")
                 lip_sync_service = LipSyncService()
-                await lip_sync_service.sync_video_with_audio(
-                    video_path=no_subtitle_path,
-                    audio_path=new_audio_path,
-                    output_path=processed_path,
-                    sync_quality="high"
+                try:
+                    await lip_sync_service.sync_video_with_audio(
+                        video_path=proxy_stats["lipsync"]["path"],
+                        audio_path=inputs["generate_speech"],
+                        output_path=processed_path,
+                        sync_quality="high"
+                    )
+                finally:
+                    transfers.extend(lip_sync_service.transfers)
+
+            def proxy_profile(name: str):
+                return settings.AI_PROXY_PROFILES.get(name) if settings.AI_PROXY_ENABLED else None
+
+            # 去除字幕只依赖原视频，声音克隆只依赖原视频和文本，两条分支并发执行，都完成后再做口型同步；
+            # 各阶段的输入指纹和输出文件记录在任务上，重试或工作进程重启时跳过已完成的阶段
+            graph = StageGraph([
+                # 1. 使用AI模型去除字幕并修复背景
+                Stage("inpaint", inpaint, error_label="AI移除字幕失败",
+                      fingerprint=lambda: {"input": input_sha256, "proxy": proxy_profile("runway"),
+                                           "mask_type": "text", "quality": "high"},
+                      artifact=no_subtitle_path),
+                # 2. 使用MockingBird或YourTTS进行声音克隆
+                Stage("extract_voice", extract_voice, error_label="AI语音克隆失败",
+                      fingerprint=lambda: {"input": input_sha256}),
+                Stage("generate_speech", generate_speech, ("extract_voice",), error_label="AI语音克隆失败",
+                      fingerprint=lambda: {"text": text, "quality": "high"},
+                      artifact=new_audio_path),
+                # 3. 使用Wav2Lip或SadTalker进行唇形同步
+                Stage("lip_sync", lip_sync, ("inpaint", "generate_speech"), error_label="AI口型同步失败",
+                      fingerprint=lambda: {"proxy": proxy_profile("lipsync"), "quality": "high"},
+                      artifact=processed_path),
+            ])
+            checkpoints = task.data.setdefault("checkpoints", {})
+
+            def on_stage_done(stage: str, fraction: float, timings: Dict[str, dict]):
+                self.update_task_status(
+                    task.task_id, TaskStatus.RUNNING, 10 + int(80 * fraction),
+                    result={"stages": dict(timings)}
                 )
-                self.update_task_status(task.task_id, TaskStatus.RUNNING, 90)
-            except Exception as e:
-                raise Exception(f"AI口型同步失败: {str(e)}")
 
-            # 4. 清理临时文件
-            for temp_file in [no_subtitle_path, new_audio_path]:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
+            _, stage_timings = await graph.run(on_stage_done, checkpoints)
+
+            # 4. 登记处理结果，供相同输入和文本的任务复用
+            output_sha256 = await blob_store.store_processed(input_sha256, text, processed_path, task.user_id)
+            metadata = await video_index.index(processed_path, task.user_id, output_sha256)
+
+            proxy_summary = {
+                stage: {key: stats[key] for key in ("source_size", "proxy_size", "bytes_saved", "cached", "seconds")}
+                for stage, stats in proxy_stats.items()
+            }
+            logger.info(
+                f"Task {task.task_id} proxy uploads saved "
+                f"{sum(stats['bytes_saved'] for stats in proxy_summary.values())} bytes: {proxy_summary}"
+            )
 
             self.update_task_status(
                 task.task_id,
                 TaskStatus.COMPLETED,
                 100,
                 result={
-                    "processed_path": processed_path
+                    "processed_path": processed_path,
+                    "proxy": proxy_summary,
+                    "transfers": [transfer.to_dict() for transfer in transfers],
+                    "stages": stage_timings,
+                    "voice_cache": voice_service.cache_hits,
+                    **self._schedule_hls(processed_path, output_sha256, metadata)
                 }
             )
 
@@ -347,4 +915,11 @@ class TaskQueue:
                 TaskStatus.FAILED,
                 100,
                 error=str(e)
-            )
\ No newline at end of file
+            )
+        finally:
+            # 处理成功或不会再重试时清理中间文件和检查点；还会重试时保留，供下次执行跳过已完成的阶段
+            if task.status == TaskStatus.COMPLETED or task.retry_count >= task.max_retries:
+                task.data.pop("checkpoints", None)
+                for temp_file in temp_files:
+                    if os.path.exists(temp_file):
+                        os.remove(temp_file)
\ No newline at end of file
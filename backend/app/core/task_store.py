@@ -0,0 +1,344 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 任务表的列，顺序与 upsert 语句保持一致
+TASK_COLUMNS = [
+    "task_id",
+    "task_type",
+    "user_id",
+    "status",
+    "progress",
+    "data",
+    "result",
+    "error",
+    "retry_count",
+    "max_retries",
+    "created_at",
+    "updated_at",
+    "schedule_at",
+    "last_retry",
+    "next_attempt_at",
+    "priority",
+    "lease_owner",
+]
+
+# 建表之后新增的列，打开旧数据库时自动补齐
+ADDED_COLUMNS = {
+    "next_attempt_at": "REAL",
+    "priority": "TEXT",
+    "lease_owner": "TEXT",
+    "lease_expires_at": "REAL",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    task_type TEXT NOT NULL,
+    user_id INTEGER,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    data TEXT,
+    result TEXT,
+    error TEXT,
+    retry_count INTEGER NOT NULL DEFAULT 0,
+    max_retries INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    schedule_at REAL,
+    last_retry REAL,
+    next_attempt_at REAL,
+    priority TEXT,
+    lease_owner TEXT,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status_schedule ON tasks (status, schedule_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_user_created ON tasks (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_updated ON tasks (updated_at);
+"""
+
+# 依赖后补列的索引，需要在补齐列之后创建
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_tasks_status_next_attempt ON tasks (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_status_lease ON tasks (status, lease_expires_at);
+"""
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return json.dumps(value, default=_json_default, ensure_ascii=False)
+
+def loads(value: Optional[str]) -> Any:
+    if value is None:
+        return None
+    return json.loads(value)
+
+class TaskStore:
+    """基于SQLite的任务持久化存储
+
+    写入先在内存中按任务合并，再由后台协程批量刷入数据库，
+    数据库操作都在线程池中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        # 同一时刻只有一次写入，保证较新的快照总是在较旧的之后提交
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            db_dir = os.path.dirname(os.path.abspath(self.db_file))
+            os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            self._ensure_columns(conn)
+            conn.executescript(INDEXES)
+            self._conn = conn
+        return self._conn
+
+    def _ensure_columns(self, conn: sqlite3.Connection):
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(tasks)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {column_type}")
+
+    def mark_dirty(self, record: Dict[str, Any]):
+        """记录任务的最新状态，同一任务的多次修改只保留最后一次"""
+        self._dirty[record["task_id"]] = record
+
+    def _write(self, records: List[Dict[str, Any]]):
+        placeholders = ", ".join("?" for _ in TASK_COLUMNS)
+        updates = ", ".join(f"{col} = excluded.{col}" for col in TASK_COLUMNS[1:])
+        # 租约已被回收或转给其他工作进程时，旧持有者的写入会被忽略
+        sql = (
+            f"INSERT INTO tasks ({', '.join(TASK_COLUMNS)}) VALUES ({placeholders}) "
+            f"ON CONFLICT(task_id) DO UPDATE SET {updates} "
+            f"WHERE tasks.lease_owner IS excluded.lease_owner"
+        )
+        rows = [tuple(record.get(col) for col in TASK_COLUMNS) for record in records]
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(sql, rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    async def flush(self):
+        """把合并后的脏记录在一个事务中写入数据库"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            records = list(self._dirty.values())
+            self._dirty = {}
+            try:
+                await asyncio.to_thread(self._write, records)
+            except Exception as e:
+                logger.error(f"Error flushing {len(records)} tasks to store: {e}")
+                # 写入失败时放回，新的修改优先
+                for record in records:
+                    self._dirty.setdefault(record["task_id"], record)
+
+    async def run_flusher(self, interval: float):
+        """后台批量写入循环"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def close(self):
+        """关闭连接，同时把WAL日志合并回数据库文件"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, tuple(params)).fetchall()]
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        record = self._dirty.get(task_id)
+        if record is not None:
+            return record
+        rows = self._query("SELECT * FROM tasks WHERE task_id = ?", (task_id,))
+        return rows[0] if rows else None
+
+    def query(self, user_id: Optional[int] = None, status: Optional[str] = None,
+              task_type: Optional[str] = None, limit: Optional[int] = None,
+              offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+        """按用户、状态、类型筛选任务，按创建时间倒序分页，返回 (总数, 记录列表)"""
+        conditions = []
+        params: List[Any] = []
+        for column, value in (("user_id", user_id), ("status", status), ("task_type", task_type)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        total = self._query(f"SELECT COUNT(*) AS total FROM tasks {where}", params)[0]["total"]
+        rows = self._query(
+            f"SELECT * FROM tasks {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (*params, limit if limit is not None else -1, offset),
+        )
+        return total, rows
+
+    def status_counts(self) -> Dict[str, int]:
+        rows = self._query("SELECT status, COUNT(*) AS total FROM tasks GROUP BY status")
+        return {row["status"]: row["total"] for row in rows}
+
+    def claim(self, owner: str, task_type: str, limit: int, lease_seconds: float,
+              priorities: List[str]) -> List[Dict[str, Any]]:
+        """为工作进程领取到期的任务并加租约
+
+        同一时刻只有一个进程能在 BEGIN IMMEDIATE 事务中领取任务。
+        按优先级、用户内的排队序号排序，使各用户的任务轮流被领取。
+        """
+        if limit <= 0:
+            return []
+        now = time.time()
+        priority_rank = " ".join(
+            f"WHEN ? THEN {rank}" for rank in range(len(priorities))
+        )
+        sql = f"""
+            SELECT task_id FROM (
+                SELECT task_id, priority, created_at,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at) AS user_rank
+                FROM tasks
+                WHERE task_type = ? AND (
+                    status = 'pending'
+                    OR (status = 'scheduled' AND schedule_at <= ?)
+                    OR (status = 'retrying' AND next_attempt_at <= ?)
+                )
+            )
+            ORDER BY CASE priority {priority_rank} ELSE {len(priorities)} END,
+                     user_rank, created_at
+            LIMIT ?
+        """
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                task_ids = [
+                    row["task_id"]
+                    for row in conn.execute(sql, (task_type, now, now, *priorities, limit))
+                ]
+                if task_ids:
+                    placeholders = ", ".join("?" for _ in task_ids)
+                    conn.execute(
+                        f"UPDATE tasks SET status = 'running', lease_owner = ?, lease_expires_at = ?, "
+                        f"updated_at = ? WHERE task_id IN ({placeholders})",
+                        (owner, now + lease_seconds, now, *task_ids),
+                    )
+                    rows = conn.execute(
+                        f"SELECT * FROM tasks WHERE task_id IN ({placeholders})", task_ids
+                    ).fetchall()
+                else:
+                    rows = []
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [dict(row) for row in rows]
+
+    def renew_leases(self, owner: str, task_ids: List[str], lease_seconds: float) -> List[str]:
+        """续约工作进程仍在执行的任务，返回续约成功的任务ID
+
+        不在返回结果中的任务租约已被回收或转给其他工作进程，调用方应停止执行。
+        """
+        if not task_ids:
+            return []
+        placeholders = ", ".join("?" for _ in task_ids)
+        condition = f"lease_owner = ? AND status = 'running' AND task_id IN ({placeholders})"
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                renewed = [
+                    row["task_id"]
+                    for row in conn.execute(f"SELECT task_id FROM tasks WHERE {condition}", (owner, *task_ids))
+                ]
+                conn.execute(
+                    f"UPDATE tasks SET lease_expires_at = ? WHERE {condition}",
+                    (time.time() + lease_seconds, owner, *task_ids),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return renewed
+
+    def reclaim_expired(self) -> int:
+        """把租约过期（工作进程崩溃或失联）的任务放回待执行状态
+
+        每次回收计一次重试，已达到最大重试次数的任务直接标记为失败，
+        避免导致工作进程崩溃的任务被无限次重新领取。
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                """
+                UPDATE tasks SET
+                    status = CASE WHEN retry_count >= max_retries THEN 'failed' ELSE 'pending' END,
+                    error = CASE WHEN retry_count >= max_retries
+                                 THEN '工作进程失联，达到最大重试次数 (' || max_retries || ')'
+                                 ELSE error END,
+                    retry_count = CASE WHEN retry_count >= max_retries
+                                       THEN retry_count ELSE retry_count + 1 END,
+                    updated_at = ?, lease_owner = NULL, lease_expires_at = NULL
+                WHERE status = 'running' AND lease_expires_at IS NOT NULL AND lease_expires_at < ?
+                """,
+                (now, now),
+            )
+            return cursor.rowcount
+
+    def release_leases(self, owner: str) -> int:
+        """工作进程退出时，把它仍持有的任务放回待执行状态"""
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE tasks SET status = 'pending', lease_owner = NULL, lease_expires_at = NULL "
+                "WHERE status = 'running' AND lease_owner = ?",
+                (owner,),
+            )
+            return cursor.rowcount
+
+    def load_by_status(self, statuses: List[str]) -> List[Dict[str, Any]]:
+        placeholders = ", ".join("?" for _ in statuses)
+        return self._query(
+            f"SELECT * FROM tasks WHERE status IN ({placeholders}) ORDER BY created_at",
+            statuses,
+        )
+
+    def _delete_before(self, statuses: List[str], before: float) -> int:
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock:
+            cursor = self.conn.execute(
+                f"DELETE FROM tasks WHERE status IN ({placeholders}) AND updated_at < ?",
+                (*statuses, before),
+            )
+            return cursor.rowcount
+
+    async def delete_before(self, statuses: List[str], before: datetime) -> int:
+        """删除指定状态且在某时间之前未更新的任务"""
+        return await asyncio.to_thread(self._delete_before, statuses, before.timestamp())
@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+import aiofiles
+import aiofiles.os
+import aiohttp
+from aiohttp.abc import AbstractStreamWriter
+from aiohttp.payload import Payload
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class TransferError(Exception):
+    """下载内容与响应声明的长度或摘要不一致"""
+
+@dataclass
+class TransferStats:
+    label: str
+    direction: str  # upload / download
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return round(self.bytes / 1024 / 1024 / self.seconds, 2) if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "label": self.label,
+            "direction": self.direction,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+            "mb_per_second": self.mb_per_second,
+        }
+
+    def log(self):
+        logger.info(f"{self.label} {self.direction} {self.bytes} bytes in {self.seconds:.2f}s "
+                    f"({self.mb_per_second} MB/s)")
+
+class FilePayload(Payload):
+    """按大块异步读取的文件请求体
+
+    大小事先已知，请求带 Content-Length；每次发送都重新打开文件，
+    连接断开后 aiohttp 重发请求时可以再次读取。
+    """
+
+    def __init__(self, path: str, size: int, form: "StreamingForm", **kwargs):
+        super().__init__(path, filename=os.path.basename(path), **kwargs)
+        self._size = size
+        self._form = form
+
+    async def write(self, writer: AbstractStreamWriter) -> None:
+        self._form.start()
+        async with aiofiles.open(self._value, "rb") as f:
+            while True:
+                chunk = await f.read(settings.HTTP_TRANSFER_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await writer.write(chunk)
+                self._form.stats.bytes += len(chunk)
+
+    def decode(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        raise TypeError("File payloads are streamed and cannot be decoded")
+
+class StreamingForm:
+    """multipart/form-data 请求体，文件字段从磁盘流式发送，不在内存中拼接"""
+
+    def __init__(self, label: str):
+        self.writer = aiohttp.MultipartWriter("form-data")
+        self.stats = TransferStats(label, "upload")
+        self._started: Optional[float] = None
+
+    def add_field(self, name: str, value):
+        part = self.writer.append(str(value))
+        part.set_content_disposition("form-data", name=name)
+
+    async def add_file(self, name: str, path: str):
+        st = await aiofiles.os.stat(path)
+        payload = FilePayload(path, st.st_size, self)
+        payload.set_content_disposition("form-data", name=name, filename=os.path.basename(path))
+        self.writer.append_payload(payload)
+
+    def start(self):
+        if self._started is None:
+            self._started = time.monotonic()
+
+    def finish(self) -> TransferStats:
+        """收到响应后调用，耗时从开始发送文件算到服务端返回响应"""
+        if self._started is not None:
+            self.stats.seconds = time.monotonic() - self._started
+        self.stats.log()
+        return self.stats
+
+def _expected_sha256(headers) -> Optional[str]:
+    """响应声明的内容摘要：Repr-Digest: sha-256=:<base64>: 或 Digest: SHA-256=<base64>"""
+    for header in ("Repr-Digest", "Digest"):
+        for item in headers.get(header, "").split(","):
+            algorithm, _, value = item.strip().partition("=")
+            if algorithm.lower() == "sha-256" and value:
+                try:
+                    return base64.b64decode(value.strip(":")).hex()
+                except ValueError:
+                    return None
+    return None
+
+async def download_to(response: aiohttp.ClientResponse, dest_path: str, label: str) -> TransferStats:
+    """把响应体写入 dest_path
+
+    先写入同目录下的临时文件，长度与 Content-Length、摘要与 Repr-Digest/Digest 一致后
+    再原子重命名，失败时不会留下不完整的文件。
+    """
+    response.raise_for_status()
+    stats = TransferStats(label, "download")
+    # 内容经过压缩时 Content-Length 是压缩后的长度，不能用来校验解压后的数据
+    expected_size = None if response.headers.get("Content-Encoding") else response.content_length
+    expected_sha256 = _expected_sha256(response.headers)
+    digest = hashlib.sha256()
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.part"
+    started = time.monotonic()
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            async for chunk in response.content.iter_chunked(settings.HTTP_TRANSFER_CHUNK_SIZE):
+                await f.write(chunk)
+                digest.update(chunk)
+                stats.bytes += len(chunk)
+        if expected_size is not None and stats.bytes != expected_size:
+            raise TransferError(f"{label}: received {stats.bytes} of {expected_size} bytes")
+        if expected_sha256 and digest.hexdigest() != expected_sha256:
+            raise TransferError(f"{label}: SHA-256 mismatch")
+        if stats.bytes == 0:
+            raise TransferError(f"{label}: empty response body")
+        await aiofiles.os.replace(tmp_path, dest_path)
+    finally:
+        try:
+            await aiofiles.os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+    stats.seconds = time.monotonic() - started
+    stats.log()
+    return stats
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import aiofiles
+
+from app.core.config import settings
+
+class UploadSessionError(Exception):
+    """可续传上传会话的错误"""
+
+class UploadSessionNotFound(UploadSessionError):
+    pass
+
+class UploadIncomplete(UploadSessionError):
+    pass
+
+class UploadCompleting(UploadSessionError):
+    """会话正在完成，不再接受分块"""
+
+def merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """把 [start, end) 合并进已排序且互不重叠的区间列表"""
+    merged: List[List[int]] = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+def _file_sha256(path: str, chunk_size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class UploadSessionStore:
+    """可续传的分块上传会话
+
+    每个会话一个目录，包含会话信息 meta.json 和按最终大小预分配的数据文件。
+    分块可以乱序、并行写入各自的偏移位置，已接收的区间记录在会话信息中；
+    完成时数据文件直接重命名为目标文件，不再复制数据；完成期间拒绝新的分块，
+    并等待正在写入的分块结束后再校验和移动数据文件。
+    会话目录需要与上传目录在同一文件系统上。
+    """
+
+    def __init__(self, root: str, ttl_seconds: float, chunk_size: int):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.chunk_size = chunk_size
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._writers: Dict[str, int] = {}  # 会话 -> 正在写入的分块数
+        self._completing: Set[str] = set()
+        self._writers_done = asyncio.Condition()
+
+    def _session_dir(self, upload_id: str) -> str:
+        return os.path.join(self.root, upload_id)
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self._session_dir(upload_id), "meta.json")
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self._session_dir(upload_id), "data")
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        lock = self._locks.get(upload_id)
+        if lock is None:
+            lock = self._locks[upload_id] = asyncio.Lock()
+        return lock
+
+    def _load(self, upload_id: str) -> Optional[dict]:
+        try:
+            with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save(self, meta: dict):
+        path = self._meta_path(meta["upload_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _create(self, meta: dict):
+        os.makedirs(self._session_dir(meta["upload_id"]), exist_ok=True)
+        # 稀疏文件，分块写入各自的偏移位置
+        with open(self._data_path(meta["upload_id"]), "wb") as f:
+            f.truncate(meta["size"])
+        self._save(meta)
+
+    async def create(self, user_id: int, filename: str, size: int,
+                     sha256: Optional[str] = None) -> dict:
+        """创建上传会话"""
+        await self.cleanup_expired()
+        now = time.time()
+        meta = {
+            "upload_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "filename": os.path.basename(filename),
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "received": [],
+            "created_at": now,
+            "updated_at": now,
+        }
+        await asyncio.to_thread(self._create, meta)
+        return meta
+
+    async def get(self, upload_id: str, user_id: int) -> dict:
+        meta = await asyncio.to_thread(self._load, upload_id) if upload_id.isalnum() else None
+        if meta is None or meta["user_id"] != user_id:
+            raise UploadSessionNotFound(upload_id)
+        return meta
+
+    async def write_chunk(self, upload_id: str, user_id: int, offset: int,
+                          stream: AsyncIterator[bytes]) -> dict:
+        """把请求体流式写入数据文件的 offset 位置
+
+        连接中断时已经写入的部分同样记为已接收，客户端只需补传剩余部分。
+        """
+        meta = await self.get(upload_id, user_id)
+        if offset < 0 or offset > meta["size"]:
+            raise UploadSessionError("分块偏移超出文件范围")
+        if upload_id in self._completing:
+            raise UploadCompleting("上传正在完成，不再接受分块")
+
+        self._writers[upload_id] = self._writers.get(upload_id, 0) + 1
+        written = 0
+        try:
+            async with aiofiles.open(self._data_path(upload_id), "r+b") as f:
+                await f.seek(offset)
+                async for chunk in stream:
+                    if not chunk:
+                        continue
+                    if offset + written + len(chunk) > meta["size"]:
+                        raise UploadSessionError("分块超出文件大小")
+                    await f.write(chunk)
+                    written += len(chunk)
+        finally:
+            if written:
+                async with self._lock(upload_id):
+                    meta = await asyncio.to_thread(self._load, upload_id)
+                    if meta is not None:
+                        meta["received"] = merge_range(meta["received"], offset, offset + written)
+                        meta["updated_at"] = time.time()
+                        await asyncio.to_thread(self._save, meta)
+            async with self._writers_done:
+                self._writers[upload_id] -= 1
+                if not self._writers[upload_id]:
+                    del self._writers[upload_id]
+                self._writers_done.notify_all()
+        return meta
+
+    async def complete(self, upload_id: str, user_id: int, dest_path: str) -> Tuple[int, str]:
+        """校验数据完整后把数据文件移动到 dest_path，返回 (字节数, SHA-256)
+
+        先标记会话正在完成并等待进行中的分块写完，校验失败时取消标记，客户端可以继续补传。
+        """
+        await self.get(upload_id, user_id)
+        if upload_id in self._completing:
+            raise UploadCompleting("上传正在完成")
+        self._completing.add(upload_id)
+        try:
+            async with self._writers_done:
+                await self._writers_done.wait_for(lambda: not self._writers.get(upload_id))
+            async with self._lock(upload_id):
+                meta = await self.get(upload_id, user_id)
+                if meta["received"] != [[0, meta["size"]]] and meta["size"] > 0:
+                    raise UploadIncomplete(upload_id)
+
+                data_path = self._data_path(upload_id)
+                sha256 = await asyncio.to_thread(_file_sha256, data_path, self.chunk_size)
+                if meta["sha256"] and meta["sha256"] != sha256:
+                    raise UploadSessionError("文件校验和不匹配")
+
+                os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+                await asyncio.to_thread(os.replace, data_path, dest_path)
+                await asyncio.to_thread(shutil.rmtree, self._session_dir(upload_id), True)
+        finally:
+            self._completing.discard(upload_id)
+        self._locks.pop(upload_id, None)
+        return meta["size"], sha256
+
+    async def abort(self, upload_id: str, user_id: int):
+        await self.get(upload_id, user_id)
+        await asyncio.to_thread(shutil.rmtree, self._session_dir(upload_id), True)
+        self._locks.pop(upload_id, None)
+
+    def _cleanup_expired(self) -> int:
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        deadline = time.time() - self.ttl_seconds
+        for upload_id in os.listdir(self.root):
+            meta = self._load(upload_id)
+            updated_at = meta["updated_at"] if meta else os.path.getmtime(self._session_dir(upload_id))
+            if updated_at < deadline:
+                shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+                removed += 1
+        return removed
+
+    async def cleanup_expired(self) -> int:
+        """删除长时间没有新分块的会话"""
+        return await asyncio.to_thread(self._cleanup_expired)
+
+# 全局续传会话存储
+upload_sessions = UploadSessionStore(
+    settings.UPLOAD_SESSION_DIR, settings.UPLOAD_SESSION_TTL, settings.UPLOAD_CHUNK_SIZE
+)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import uuid
+from typing import Dict, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+
+from app.core.config import settings
+
+# 单文件上传的表单中，除文件内容外的字段和分隔符所占的字节数上限
+MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadTooLarge(Exception):
+    """上传文件超过大小限制"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"File exceeds the upload limit of {max_size} bytes")
+
+class UploadSizeLimitMiddleware:
+    """在读取表单之前按请求体大小拒绝超限的上传
+
+    FastAPI 在调用接口之前就会把整个 multipart 请求体写入临时文件，接口中的检查只能在接收完之后进行。
+    这里先检查 Content-Length，超限时直接返回 413；没有 Content-Length（分块传输）时边接收边计数，
+    超限后立即停止接收。limits 为路径 -> 请求体字节数上限。
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def _reject(self, send, max_size: int):
+        body = json.dumps({"detail": f"请求体超过大小限制（{max_size} 字节）"}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        max_size = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if max_size is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        try:
+            content_length = int(headers.get(b"content-length", b""))
+        except ValueError:
+            content_length = None
+        if content_length is not None and content_length > max_size:
+            return await self._reject(send, max_size)
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_size:
+                    # 不再接收，表单解析因连接断开而失败，其响应替换为 413
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        rejected = False
+
+        async def limited_send(message):
+            nonlocal rejected
+            if not exceeded:
+                await send(message)
+            elif message["type"] == "http.response.start" and not rejected:
+                rejected = True
+                await self._reject(send, max_size)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not rejected:
+            await self._reject(send, max_size)
+
+def check_upload_size(upload: UploadFile, max_size: Optional[int] = None):
+    """按表单解析得到的文件大小拒绝超限的上传
+
+    此时请求体已经接收完毕（写入了临时文件），只是不再保存；单文件上传接口由
+    UploadSizeLimitMiddleware 在接收之前拒绝，批量上传的每个文件在这里检查。
+    """
+    max_size = max_size or settings.MAX_UPLOAD_SIZE
+    if upload.size is not None and upload.size > max_size:
+        raise UploadTooLarge(max_size)
+
+async def save_upload(upload: UploadFile, dest_path: str,
+                      max_size: Optional[int] = None) -> Tuple[int, str]:
+    """把上传文件分块流式写入磁盘，返回 (字节数, SHA-256)
+
+    内容先写入同目录下的临时文件，写完后再原子重命名为目标文件，
+    超出大小限制或写入失败时删除临时文件，不会留下不完整的文件。
+    """
+    max_size = max_size or settings.MAX_UPLOAD_SIZE
+    check_upload_size(upload, max_size)
+    
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                chunk = await upload.read(settings.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(max_size)
+                digest.update(chunk)
+                await out.write(chunk)
+        await aiofiles.os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return size, digest.hexdigest()
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, delete, func, null
+
+from app.core.media import Coalescer, MediaCommandError, probe
+from app.db.database import SessionLocal
+from app.models.video_metadata import VideoMetadata
+
+logger = logging.getLogger(__name__)
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_int(value) -> Optional[int]:
+    value = _to_float(value)
+    return int(value) if value is not None else None
+
+def _frame_rate(value: Optional[str]) -> Optional[float]:
+    # ffprobe 的帧率是分数形式，如 30000/1001，未知时为 0/0
+    if not value:
+        return None
+    numerator, _, denominator = value.partition("/")
+    numerator, denominator = _to_float(numerator), _to_float(denominator or 1)
+    if not numerator or not denominator:
+        return None
+    return round(numerator / denominator, 3)
+
+def parse_probe(result: dict) -> dict:
+    """从 ffprobe JSON 中提取常用字段"""
+    fmt = result.get("format") or {}
+    streams = result.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    return {
+        "duration": _to_float(fmt.get("duration")) or _to_float(video.get("duration")),
+        "width": _to_int(video.get("width")),
+        "height": _to_int(video.get("height")),
+        "fps": _frame_rate(video.get("avg_frame_rate")) or _frame_rate(video.get("r_frame_rate")),
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "bit_rate": _to_int(fmt.get("bit_rate")),
+        "format_name": fmt.get("format_name"),
+    }
+
+class VideoMetadataIndex:
+    """视频元数据索引
+
+    上传时调用一次 ffprobe 并写入数据库，之后按路径直接查询；
+    文件大小或修改时间与索引不一致时重新解析。
+    无法解析的文件也记录一行（probe 为 NULL），文件变化之前不再重复调用 ffprobe。
+    """
+
+    def __init__(self):
+        self._coalescer = Coalescer()
+
+    def _load(self, path: str) -> Optional[VideoMetadata]:
+        with SessionLocal() as db:
+            return db.execute(select(VideoMetadata).where(VideoMetadata.path == path)).scalars().first()
+
+    def _save(self, path: str, st: os.stat_result, result: Optional[dict], user_id: Optional[int],
+              sha256: Optional[str]) -> VideoMetadata:
+        with SessionLocal() as db:
+            row = db.execute(select(VideoMetadata).where(VideoMetadata.path == path)).scalars().first()
+            if row is None:
+                row = VideoMetadata(path=path)
+                db.add(row)
+            row.user_id = user_id if user_id is not None else row.user_id
+            row.sha256 = sha256 or row.sha256
+            row.size = st.st_size
+            row.mtime_ns = st.st_mtime_ns
+            for key, value in parse_probe(result or {}).items():
+                setattr(row, key, value)
+            row.probe = result if result is not None else null()
+            row.probed_at = datetime.now()
+            db.commit()
+            db.refresh(row)
+            return row
+
+    async def _index(self, path: str, user_id: Optional[int], sha256: Optional[str]) -> Optional[dict]:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logger.warning(f"Failed to probe {path}: {e}")
+            return None
+        try:
+            result = await probe(path)
+        except (MediaCommandError, OSError, ValueError) as e:
+            logger.warning(f"Failed to probe {path}: {e}")
+            result = None
+        row = await asyncio.to_thread(self._save, path, st, result, user_id, sha256)
+        return row.to_dict() if row.probe is not None else None
+
+    async def index(self, path: str, user_id: Optional[int] = None,
+                    sha256: Optional[str] = None) -> Optional[dict]:
+        """解析视频并写入索引，无法解析（非视频文件、ffprobe 不可用）时返回 None"""
+        return await self._coalescer.run(path, lambda: self._index(path, user_id, sha256))
+
+    async def get(self, path: Optional[str]) -> Optional[dict]:
+        """查询视频元数据，文件变化或尚未索引时重新解析"""
+        if not path or not os.path.isfile(path):
+            return None
+        st = os.stat(path)
+        row = await asyncio.to_thread(self._load, path)
+        if row is not None and row.size == st.st_size and row.mtime_ns == st.st_mtime_ns:
+            return row.to_dict() if row.probe is not None else None
+        return await self.index(path, row.user_id if row else None, row.sha256 if row else None)
+
+    def _remove(self, path: str):
+        with SessionLocal() as db:
+            db.execute(delete(VideoMetadata).where(VideoMetadata.path == path))
+            db.commit()
+
+    async def remove(self, path: str):
+        await asyncio.to_thread(self._remove, path)
+
+    def _user_summary(self, user_id: int) -> dict:
+        with SessionLocal() as db:
+            count, total_duration, total_size = db.execute(
+                select(
+                    func.count(VideoMetadata.id),
+                    func.coalesce(func.sum(VideoMetadata.duration), 0),
+                    func.coalesce(func.sum(VideoMetadata.size), 0)
+                ).where(VideoMetadata.user_id == user_id, VideoMetadata.probe.isnot(None))
+            ).one()
+            by_resolution = db.execute(
+                select(VideoMetadata.width, VideoMetadata.height, func.count(VideoMetadata.id))
+                .where(VideoMetadata.user_id == user_id, VideoMetadata.probe.isnot(None))
+                .group_by(VideoMetadata.width, VideoMetadata.height)
+            ).all()
+            by_codec = db.execute(
+                select(VideoMetadata.video_codec, func.count(VideoMetadata.id))
+                .where(VideoMetadata.user_id == user_id, VideoMetadata.probe.isnot(None))
+                .group_by(VideoMetadata.video_codec)
+            ).all()
+        return {
+            "total_videos": count,
+            "total_duration": total_duration,
+            "total_size": total_size,
+            "by_resolution": {
+                f"{width}x{height}" if width and height else "unknown": n
+                for width, height, n in by_resolution
+            },
+            "by_codec": {codec or "unknown": n for codec, n in by_codec}
+        }
+
+    async def user_summary(self, user_id: int) -> dict:
+        """用户视频的数量、总时长、总大小及分辨率、编码分布"""
+        return await asyncio.to_thread(self._user_summary, user_id)
+
+# 全局视频元数据索引
+video_index = VideoMetadataIndex()
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.media import Coalescer, touch_access
+
+logger = logging.getLogger(__name__)
+
+class MemoryLRU:
+    """按字节数限制容量的内存 LRU"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+
+    def get(self, key: str):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key: str, value, size: int):
+        if size > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        self._items[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.size -= evicted
+
+class VoiceCache:
+    """声音特征和合成语音的两级缓存（内存 LRU + 磁盘）
+
+    - 声音特征按音频内容哈希缓存，同一说话人不再重复上传分析；
+    - 合成语音按 (文本, 声音特征, 音质) 的哈希缓存，批量处理同一段文案时只合成一次。
+    磁盘上的文件由空间管理按 voice 目录的 TTL 和容量上限淘汰；
+    相同 key 的并发请求只会调用一次服务商接口。
+    """
+
+    def __init__(self, root: str, memory_bytes: int):
+        self.root = root
+        self.memory = MemoryLRU(memory_bytes)
+        self._coalescer = Coalescer()
+
+    @staticmethod
+    def speech_key(text: str, voice_features: Dict[str, Any], quality: str) -> str:
+        payload = json.dumps(
+            {"text": text, "voice_features": voice_features, "quality": quality},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, f"{key}{suffix}")
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        tmp_path = f"{path}.{uuid.uuid4().hex}"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _read_features(self, path: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        touch_access(path)
+        return json.loads(data), len(data)
+
+    async def get_features(self, audio_sha256: str,
+                           extract: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], str]:
+        """返回 (声音特征, 命中层级)，未命中时调用 extract 并写入缓存
+
+        命中层级为 memory/disk/miss，等待其他请求正在进行的同一调用时为 coalesced。
+        """
+        key = f"features:{audio_sha256}"
+        features = self.memory.get(key)
+        if features is not None:
+            return features, "memory"
+        path = self._path(audio_sha256, ".json")
+        cached = await asyncio.to_thread(self._read_features, path)
+        if cached is not None:
+            self.memory.put(key, *cached)
+            return cached[0], "disk"
+
+        called = False
+
+        async def fill():
+            nonlocal called
+            called = True
+            features = await extract()
+            data = json.dumps(features, ensure_ascii=False).encode("utf-8")
+            os.makedirs(self.root, exist_ok=True)
+            await asyncio.to_thread(self._write_atomic, path, data)
+            self.memory.put(key, features, len(data))
+            return features
+
+        features = await self._coalescer.run(key, fill)
+        return features, "miss" if called else "coalesced"
+
+    def _link_or_copy(self, source: str, dest: str):
+        tmp_path = f"{dest}.{uuid.uuid4().hex}"
+        try:
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, dest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _load_speech(self, path: str, dest: str) -> Optional[bytes]:
+        if not os.path.exists(path):
+            return None
+        touch_access(path)
+        self._link_or_copy(path, dest)
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def get_speech(self, key: str, output_path: str,
+                         synthesize: Callable[[str], Awaitable[None]]) -> str:
+        """把 key 对应的语音写到 output_path，返回命中层级（同 get_features）
+
+        未命中时调用 synthesize(缓存路径) 生成到缓存目录，再链接到 output_path。
+        """
+        memory_key = f"speech:{key}"
+        data = self.memory.get(memory_key)
+        if data is not None:
+            await asyncio.to_thread(self._write_atomic, output_path, data)
+            return "memory"
+        path = self._path(key, ".wav")
+        data = await asyncio.to_thread(self._load_speech, path, output_path)
+        if data is not None:
+            self.memory.put(memory_key, data, len(data))
+            return "disk"
+
+        called = False
+
+        async def fill():
+            nonlocal called
+            called = True
+            os.makedirs(self.root, exist_ok=True)
+            await synthesize(path)
+
+        await self._coalescer.run(memory_key, fill)
+        data = await asyncio.to_thread(self._load_speech, path, output_path)
+        if data is None:
+            raise FileNotFoundError(path)
+        self.memory.put(memory_key, data, len(data))
+        return "miss" if called else "coalesced"
+
+# 全局声音缓存
+voice_cache = VoiceCache(settings.VOICE_CACHE_DIR, settings.VOICE_CACHE_MEMORY_BYTES)
@@ -9,6 +9,9 @@ sys.path.append(str(backend_dir))
 
 from app.db.database import engine, AsyncSession, Base
 from app.models.user import User
+from app.models.post_history import PostHistory
+from app.models.video_blob import VideoBlob, UserVideo, ProcessedVideo
+from app.models.video_metadata import VideoMetadata
 from app.core.security import get_password_hash
 from app.core.config import settings
 from sqlalchemy import text
@@ -12,6 +12,10 @@ from app.db.database import Base, engine, AsyncSession
 from app.core.config import settings
 from app.core.security import get_password_hash
 from app.models.user import User
+from app.models.post_history import PostHistory
+from app.models.video_blob import VideoBlob, UserVideo, ProcessedVideo
+from app.models.video_metadata import VideoMetadata
+from app.db.migrate_history import migrate_douyin_history
 
 async def init_db():
     """初始化数据库表"""
@@ -54,6 +58,7 @@ async def init_all():
     """执行所有初始化步骤"""
     ensure_db_exists()
     await init_db()
+    await migrate_douyin_history()
     await create_admin()
 
 if __name__ == "__main__":
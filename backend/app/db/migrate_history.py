@@ -0,0 +1,73 @@
+import sys
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import select
+
+# 将项目根目录添加到 Python 路径中
+backend_dir = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(backend_dir))
+
+from app.db.database import Base, engine, AsyncSession
+from app.models.user import User
+from app.models.post_history import PostHistory
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+async def migrate_douyin_history():
+    """把 users.douyin_history 中的JSON历史记录迁移到 douyin_post_history 表
+
+    已迁移的任务按 task_id 跳过，可重复执行；迁移完成后清空用户的JSON列。
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    migrated = 0
+    async with AsyncSession(engine) as session:
+        result = await session.execute(
+            select(User).where(User.douyin_history.isnot(None))
+        )
+        for user in result.scalars().all():
+            records = [r for r in (user.douyin_history or []) if r.get("task_id")]
+            if records:
+                existing = await session.execute(
+                    select(PostHistory.task_id).where(
+                        PostHistory.task_id.in_([r["task_id"] for r in records])
+                    )
+                )
+                existing_ids = set(existing.scalars().all())
+                for record in records:
+                    if record["task_id"] in existing_ids:
+                        continue
+                    existing_ids.add(record["task_id"])
+                    session.add(PostHistory(
+                        task_id=record["task_id"],
+                        user_id=user.id,
+                        video_id=record.get("video_id"),
+                        title=record.get("title"),
+                        description=record.get("description"),
+                        accounts=record.get("accounts", []),
+                        failed_accounts=record.get("failed_accounts", []),
+                        success_count=record.get("success_count", 0),
+                        failed_count=record.get("failed_count", 0),
+                        status=record.get("status", "pending"),
+                        retries=record.get("retries", 0),
+                        created_at=_parse_datetime(record.get("created_at")) or datetime.now(),
+                        updated_at=_parse_datetime(record.get("updated_at"))
+                    ))
+                    migrated += 1
+            user.douyin_history = None
+        await session.commit()
+
+    if migrated:
+        print(f"Migrated {migrated} douyin history records")
+    return migrated
+
+if __name__ == "__main__":
+    asyncio.run(migrate_douyin_history())
@@ -3,9 +3,19 @@ from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 from app.api.v1 import auth, users, douyin, admin
 from app.core.task_queue import TaskQueue
+from app.core.storage_manager import storage_manager
+from app.core.http_client import http_client
+from app.core.config import settings
+from app.core.uploads import MULTIPART_OVERHEAD, UploadSizeLimitMiddleware
 
 app = FastAPI(title="AiEmpowerment API")
 
+# 单文件上传在读取表单之前按请求体大小拒绝超限的文件
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={"/api/v1/douyin/upload-video": settings.MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD}
+)
+
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -27,8 +37,19 @@ task_queue = TaskQueue()
 
 @app.on_event("startup")
 async def startup_event():
+    # 创建调用AI服务的共享连接池
+    await http_client.start()
     # 启动任务队列处理器
     asyncio.create_task(task_queue.process_tasks())
+    # 定期清理缓存、临时文件和中间文件，孤儿文件的判断参考任务存储
+    storage_manager.task_store = task_queue.store
+    asyncio.create_task(storage_manager.run())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 将未写入的任务状态刷入任务存储
+    await task_queue.shutdown()
+    await http_client.close()
 
 # 包含路由
 app.include_router(auth.router, prefix="/api/v1", tags=["auth"])
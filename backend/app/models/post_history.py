@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey, Index
+from app.db.database import Base
+from datetime import datetime
+
+class PostHistory(Base):
+    """抖音发布历史记录，每个发布任务一行"""
+    __tablename__ = "douyin_post_history"
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(String, unique=True, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    video_id = Column(String, nullable=True)
+    title = Column(String, nullable=True)
+    description = Column(String, nullable=True)
+    accounts = Column(JSON, nullable=True)          # 发布的抖音账号列表
+    failed_accounts = Column(JSON, nullable=True)   # 发布失败的抖音账号列表
+    success_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    status = Column(String, default="pending", index=True)
+    retries = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+    updated_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # 按用户分页查询：WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_douyin_post_history_user_created", "user_id", "created_at", "id"),
+    )
+
+    def to_dict(self) -> dict:
+        return {
+            "task_id": self.task_id,
+            "video_id": self.video_id,
+            "title": self.title,
+            "description": self.description,
+            "accounts": self.accounts or [],
+            "failed_accounts": self.failed_accounts or [],
+            "success_count": self.success_count,
+            "failed_count": self.failed_count,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "status": self.status,
+            "retries": self.retries
+        }
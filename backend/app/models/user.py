@@ -14,7 +14,7 @@ class User(Base):
     douyin_accounts = Column(JSON, nullable=True)  # 存储多个抖音账号信息
     douyin_cookies = Column(JSON, nullable=True)   # 存储抖音账号登录后的cookies
     douyin_groups = Column(JSON, nullable=True)    # 存储抖音账号分组
-    douyin_history = Column(JSON, nullable=True)   # 存储发布历史记录
+    douyin_history = Column(JSON, nullable=True)   # 旧版发布历史记录，已迁移到 douyin_post_history 表
     last_login = Column(DateTime, nullable=True)   # 最后登录时间
     last_active = Column(DateTime, default=datetime.utcnow)  # 最后活跃时间
     reset_token = Column(String, nullable=True)    # 密码重置令牌
@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, UniqueConstraint
+from app.db.database import Base
+from datetime import datetime
+
+class VideoBlob(Base):
+    """按内容（SHA-256）存储的视频文件，相同内容只保存一份"""
+    __tablename__ = "video_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)  # 引用该内容的用户文件和处理结果缓存数量
+    created_at = Column(DateTime, default=datetime.now)
+
+class UserVideo(Base):
+    """用户可见的视频文件，硬链接到共享的视频内容"""
+    __tablename__ = "user_videos"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    path = Column(String, unique=True, nullable=False)
+    sha256 = Column(String(64), ForeignKey("video_blobs.sha256"), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+class ProcessedVideo(Base):
+    """视频处理结果缓存：相同的输入视频和文本直接复用已有的处理结果"""
+    __tablename__ = "processed_video_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    input_sha256 = Column(String(64), nullable=False)
+    text_sha256 = Column(String(64), nullable=False)
+    output_sha256 = Column(String(64), ForeignKey("video_blobs.sha256"), nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint("input_sha256", "text_sha256", name="uq_processed_video_cache_input_text"),
+    )
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, BigInteger, Float, String, JSON, DateTime, ForeignKey
+from app.db.database import Base
+from datetime import datetime
+
+class VideoMetadata(Base):
+    """视频元数据索引，上传时由 ffprobe 解析一次；文件大小或修改时间变化后重新解析"""
+    __tablename__ = "video_metadata"
+
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String, unique=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    sha256 = Column(String(64), nullable=True, index=True)
+    size = Column(BigInteger, nullable=False)
+    mtime_ns = Column(BigInteger, nullable=False)
+    duration = Column(Float, nullable=True)         # 秒
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    fps = Column(Float, nullable=True)
+    video_codec = Column(String, nullable=True)
+    audio_codec = Column(String, nullable=True)
+    bit_rate = Column(BigInteger, nullable=True)    # bit/s
+    format_name = Column(String, nullable=True)
+    probe = Column(JSON, nullable=True)             # ffprobe 原始输出
+    probed_at = Column(DateTime, default=datetime.now)
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "size": self.size,
+            "duration": self.duration,
+            "width": self.width,
+            "height": self.height,
+            "fps": self.fps,
+            "video_codec": self.video_codec,
+            "audio_codec": self.audio_codec,
+            "bit_rate": self.bit_rate,
+            "format_name": self.format_name,
+            "probed_at": self.probed_at.isoformat() if self.probed_at else None
+        }
@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 
@@ -89,6 +89,7 @@ class DouyinStats(BaseModel):
     total_posts: int
     success_rate: float
     account_stats: Dict[str, Dict[str, int]]
+    video_stats: Optional[Dict[str, Any]] = None  # 视频库统计（数量、时长、分辨率分布等）
 
 class PasswordReset(BaseModel):
     email: str  # Changed from EmailStr to str
@@ -0,0 +1,194 @@
+"""AI服务 HTTP 连接复用基准测试
+
+在本机启动一个模拟 RunwayML / Coqui / SadTalker 接口的 HTTPS 服务（自签名证书，
+需要 openssl 命令；加 --plain 使用 HTTP），用真实的服务类跑完整的视频处理请求序列，
+对比每次调用新建会话（改动前的做法）和共享连接池的连接数、握手耗时和总耗时。
+
+用法: python benchmarks/bench_ai_http_client.py [--videos 50] [--concurrency 4] [--size 256]
+"""
+import sys
+import os
+import ssl
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from aiohttp import web
+import aiohttp
+
+# 将项目根目录添加到 Python 路径中
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(backend_dir))
+
+from app.core.ai_services import RunwayMLService, VoiceCloningService, LipSyncService
+from app.core.http_client import HttpClient
+
+class StandInServer:
+    """模拟AI服务商接口：读取完整请求体，返回固定大小的结果，并记录建立过的连接"""
+
+    def __init__(self, payload_size: int, latency: float):
+        self.payload = os.urandom(payload_size)
+        self.latency = latency
+        self.connections = set()
+        self.base_url = None
+
+    async def _reply(self, request: web.Request, body) -> web.StreamResponse:
+        self.connections.add(request.transport)
+        await request.read()
+        await asyncio.sleep(self.latency)
+        if isinstance(body, bytes):
+            return web.Response(body=body, content_type="application/octet-stream")
+        return web.json_response(body)
+
+    async def upload(self, request):
+        return await self._reply(request, {"url": f"{self.base_url}/files/input.mp4"})
+
+    async def inference(self, request):
+        return await self._reply(request, {"output": {"video": f"{self.base_url}/files/output.mp4"}})
+
+    async def download(self, request):
+        return await self._reply(request, self.payload)
+
+    async def features(self, request):
+        return await self._reply(request, {"speaker": "bench"})
+
+    async def binary(self, request):
+        return await self._reply(request, self.payload)
+
+    async def start(self, ssl_context) -> web.AppRunner:
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/runway/uploads", self.upload)
+        app.router.add_post("/runway/inference", self.inference)
+        app.router.add_get("/files/{name}", self.download)
+        app.router.add_post("/coqui/voice/extract_features", self.features)
+        app.router.add_post("/coqui/tts/clone", self.binary)
+        app.router.add_post("/sadtalker/sync", self.binary)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "localhost", 0, ssl_context=ssl_context)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"{'https' if ssl_context else 'http'}://localhost:{port}"
+        return runner
+
+class PerCallClient(HttpClient):
+    """改动前的做法：每次服务调用都新建会话和连接器，连接、DNS 缓存都不复用"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sessions = []
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        session = self._create_session()
+        self.sessions.append(session)
+        return session
+
+    async def close(self):
+        for session in self.sessions:
+            await session.close()
+
+def trace_stats():
+    stats = {"connects": 0, "connect_seconds": 0.0, "dns_lookups": 0}
+    trace = aiohttp.TraceConfig()
+
+    async def on_start(session, ctx, params):
+        ctx.started = time.perf_counter()
+
+    async def on_end(session, ctx, params):
+        stats["connects"] += 1
+        stats["connect_seconds"] += time.perf_counter() - ctx.started
+
+    async def on_dns(session, ctx, params):
+        stats["dns_lookups"] += 1
+
+    trace.on_connection_create_start.append(on_start)
+    trace.on_connection_create_end.append(on_end)
+    trace.on_dns_resolvehost_end.append(on_dns)
+    return stats, trace
+
+def make_certificate(directory: str):
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run([
+        "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+        "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+        "-addext", "subjectAltName=DNS:localhost"
+    ], check=True, capture_output=True)
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert, key)
+    client_context = ssl.create_default_context(cafile=cert)
+    return server_context, client_context
+
+async def run_pipeline(client: HttpClient, base_url: str, workdir: str, index: int):
+    """与 TaskQueue._process_video 相同的AI服务调用顺序"""
+    # 不经过声音缓存，每条流水线都实际调用接口
+    runway, voice, lip_sync = RunwayMLService(client), VoiceCloningService(client, cache=None), LipSyncService(client)
+    runway.api_base = f"{base_url}/runway"
+    voice.api_base = f"{base_url}/coqui"
+    lip_sync.api_base = f"{base_url}/sadtalker"
+
+    source = os.path.join(workdir, "source.mp4")
+    no_subtitle = os.path.join(workdir, f"{index}_no_subtitle.mp4")
+    new_audio = os.path.join(workdir, f"{index}_new_audio.wav")
+    output = os.path.join(workdir, f"{index}_output.mp4")
+    await runway.inpaint_video(source, no_subtitle)
+    features = await voice.extract_voice_features(source)
+    await voice.generate_speech("bench", features, new_audio)
+    await lip_sync.sync_video_with_audio(no_subtitle, new_audio, output)
+
+async def run_once(mode: str, server: StandInServer, client_ssl, workdir: str,
+                   videos: int, concurrency: int):
+    stats, trace = trace_stats()
+    client_class = PerCallClient if mode == "per-call" else HttpClient
+    client = client_class(ssl_context=client_ssl, trace_configs=[trace])
+    server.connections.clear()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        async with semaphore:
+            await run_pipeline(client, server.base_url, workdir, index)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(videos)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return elapsed, stats, len(server.connections)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--videos", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--size", type=int, default=256, help="上传和下载的文件大小（KB）")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟服务商单次处理耗时（秒）")
+    parser.add_argument("--plain", action="store_true", help="使用 HTTP，不做 TLS 握手")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_ai_http_")
+    try:
+        with open(os.path.join(workdir, "source.mp4"), "wb") as f:
+            f.write(os.urandom(args.size * 1024))
+        server_ssl, client_ssl = (None, None) if args.plain else make_certificate(workdir)
+        server = StandInServer(args.size * 1024, args.latency)
+        runner = await server.start(server_ssl)
+
+        print(f"videos={args.videos} concurrency={args.concurrency} size={args.size}KB "
+              f"tls={not args.plain} requests/pipeline=6")
+        print(f"{'mode':>9} {'wall(s)':>8} {'ms/pipeline':>11} {'connections':>11} "
+              f"{'conn/pipeline':>13} {'connect(ms)':>11} {'dns':>5}")
+        for mode in ("per-call", "shared"):
+            elapsed, stats, connections = await run_once(
+                mode, server, client_ssl, workdir, args.videos, args.concurrency
+            )
+            print(f"{mode:>9} {elapsed:>8.2f} {elapsed / args.videos * 1000:>11.1f} {connections:>11} "
+                  f"{connections / args.videos:>13.2f} {stats['connect_seconds'] * 1000:>11.1f} "
+                  f"{stats['dns_lookups']:>5}")
+        await runner.cleanup()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    asyncio.run(main())
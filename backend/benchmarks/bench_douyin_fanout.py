@@ -0,0 +1,82 @@
+"""抖音多账号并发发布基准测试
+
+用模拟的发布后端（固定延迟）替换实际发布逻辑，测量不同并发上限下
+一个多账号发布任务的总耗时。
+
+用法: python benchmarks/bench_douyin_fanout.py [--accounts 200] [--latency 0.05]
+"""
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+# 将项目根目录添加到 Python 路径中
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(backend_dir))
+
+from app.core.config import settings
+from app.core.rate_limit import KeyedRateLimiter
+from app.core.task_queue import TaskQueue, Task
+
+class SimulatedBackend:
+    """模拟发布后端：每次发布耗时固定，并记录同时进行的最大请求数"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def post(self, account: str, video_info: dict) -> bool:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return True
+        finally:
+            self.in_flight -= 1
+
+async def run_once(queue: TaskQueue, accounts: int, latency: float, concurrency: int):
+    backend = SimulatedBackend(latency)
+    queue._post_to_account = backend.post
+    settings.DOUYIN_POST_CONCURRENCY = concurrency
+
+    task = Task(f"bench-{concurrency}", "douyin_post", {
+        "accounts": [f"account_{i}" for i in range(accounts)],
+        "video_info": {"path": "bench.mp4", "title": "bench"}
+    })
+    queue.tasks[task.task_id] = task
+
+    start = time.perf_counter()
+    success = await queue._process_douyin_post(task)
+    elapsed = time.perf_counter() - start
+
+    assert success and task.result["success_count"] == accounts
+    return elapsed, backend.max_in_flight
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟单次发布耗时（秒）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    queue = TaskQueue()
+    # 基准测试中每个账号只发布一次，不需要限流
+    queue.account_limiter = KeyedRateLimiter(0, 1)
+
+    async def no_history(task):
+        pass
+    queue.update_history = no_history
+
+    print(f"accounts={args.accounts} latency={args.latency}s")
+    print(f"{'concurrency':>11} {'wall(s)':>9} {'posts/s':>9} {'speedup':>8} {'max_inflight':>12}")
+    baseline = None
+    for concurrency in args.concurrency:
+        elapsed, max_in_flight = await run_once(queue, args.accounts, args.latency, concurrency)
+        baseline = baseline or elapsed
+        print(f"{concurrency:>11} {elapsed:>9.2f} {args.accounts / elapsed:>9.1f} "
+              f"{baseline / elapsed:>7.1f}x {max_in_flight:>12}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+
+from app.core.http_client import http_client
+from app.core.task_queue import TaskQueue
+
+# 账号发布限流的令牌桶在进程内存中，发布任务只由一个进程领取
+POST_TASK_TYPES = {"douyin_post"}
+
+async def main(claim_posts: bool):
+    # 独立的任务工作进程：通过租约从任务存储领取任务执行
+    task_queue = TaskQueue()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    runner = asyncio.create_task(
+        task_queue.run_worker(excluded_types=None if claim_posts else POST_TASK_TYPES)
+    )
+    waiter = asyncio.create_task(stop.wait())
+    await asyncio.wait([runner, waiter], return_when=asyncio.FIRST_COMPLETED)
+    runner.cancel()
+    waiter.cancel()
+    await asyncio.gather(runner, waiter, return_exceptions=True)
+    # 写入已完成任务的状态，并释放未完成任务的租约
+    await task_queue.shutdown()
+    await http_client.close()
+
+def run(claim_posts: bool = True):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(claim_posts))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="任务工作进程")
+    parser.add_argument("--processes", type=int, default=1, help="启动的工作进程数量")
+    parser.add_argument("--no-post", action="store_true",
+                        help="不领取发布任务；在多台机器上运行时，只保留一个领取发布任务的 worker.py")
+    args = parser.parse_args()
+    
+    if args.processes <= 1:
+        run(not args.no_post)
+    else:
+        # 只有第一个子进程领取发布任务，使账号限流对所有进程生效
+        processes = [
+            multiprocessing.Process(target=run, args=(index == 0 and not args.no_post,))
+            for index in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # 子进程同样收到中断信号，等待它们释放租约后退出
+            for process in processes:
+                process.join()